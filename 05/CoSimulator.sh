@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# Usage: 'CoSimulator.sh Prog.hack [max_cycles] [--batch N]'
+# Runs Prog.hack on the emulator and checks every cycle against the gate-level CPU.hdl:
+# writeM, addressM, outM and the next A, D and PC. Stops at the first cycle where they
+# differ and prints it with the few cycles before it; exits with status 1 in that case.
+# Cycles are checked N at a time (default 4096) in one bit-parallel evaluation of CPU.hdl.
+
+python3 src/cosim.py "$@"
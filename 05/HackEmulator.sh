@@ -0,0 +1,13 @@
+#!/bin/bash
+
+# Usage: 'HackEmulator.sh Prog.hack [max cycles] [--jit | --skip-idle] [--key CYCLE:CODE ...] [--load SNAP] [--save SNAP]'
+# where 'Prog.hack' is a .hack text file or a packed .hackb file. Runs the program
+# on an emulated Hack computer and prints the final CPU registers and RAM[0:16].
+# --jit runs basic blocks as compiled Python, using labels from Prog.sym if present
+# (see the assembler's --symbols option).
+# --skip-idle jumps over idle loops (Sys.wait, keyboard polling) in bulk, and
+# --key CYCLE:CODE presses key CODE once CYCLE cycles have run (0 releases it).
+# --load starts from a snapshot of the whole machine state, and --save writes one
+# after the run, so a long boot only has to be emulated once.
+
+python3 src/emulator.py "$@"
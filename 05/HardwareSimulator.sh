@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# Usage: 'HardwareSimulator.sh Chip [Chip ...] [--no-cache]'
+# where each 'Chip' is the name of a chip in 01, 02, 03/a, 03/b or 05, e.g. Mux8Way16.
+# Flattens each chip to Nand gates and prints its size. Combinational chips of projects
+# 01 and 02 are also checked against a Python model of their specification, exhaustively
+# for every output bit that depends on few enough input bits, and on random inputs otherwise.
+# Optimized netlists are cached in ~/.cache/hack-hdl, keyed by a hash of the HDL; pass
+# --no-cache to bypass the cache.
+
+python3 src/hdl_simulator.py "$@"
@@ -0,0 +1,163 @@
+"""Lockstep emulation of many Hack computers running the same ROM.
+
+Requires NumPy.
+
+Each of the N machines has its own A, D and PC (length-N vectors) and RAM
+(a row of an N x 32K matrix). Every step, all machines execute the
+instruction at their own PC at once: the instruction words are gathered
+from the ROM, the ALU is evaluated on whole vectors straight from the
+control bits, and writes and jumps are applied through masks, so machines
+whose PCs have diverged cost no more than machines in step. While every
+machine is at the same PC, which is the common case for data-independent
+code, the instruction is decoded once and only the vector operations it
+actually needs are run.
+
+Example usage:
+    import numpy as np
+    from batch_emulator import BatchEmulator
+
+    emu = BatchEmulator.from_file('Prog.hack', 1000)
+    emu.ram[:, 0] = np.arange(1000) # a different input for each machine
+    emu.run(100_000)
+    emu.ram[:, 1] # each machine's result
+"""
+from array import array
+import numpy as np
+from emulator import Emulator, load_rom, RAM_SIZE, KBD
+
+class BatchEmulator:
+    """N Hack computers advancing in lockstep on one ROM."""
+
+    def __init__(self, rom, n: int):
+        """'rom' is an iterable of 16-bit instruction words."""
+        self.rom = np.array(rom, dtype=np.uint16)
+        # one zero word past the end, so gathering at a halted pc is safe
+        self._rom = np.append(self.rom, np.uint16(0))
+        self.n = n
+        self.ram = np.zeros((n, RAM_SIZE), dtype=np.uint16)
+        self._none = np.zeros(n, dtype=bool)
+        self.reset()
+
+    @classmethod
+    def from_file(cls, path: str, n: int):
+        return cls(load_rom(path), n)
+
+    def reset(self):
+        """Reset every CPU. RAM is left untouched."""
+        self.a = np.zeros(self.n, dtype=np.uint16)
+        self.d = np.zeros(self.n, dtype=np.uint16)
+        self.pc = np.zeros(self.n, dtype=np.int64)
+        self.cycles = np.zeros(self.n, dtype=np.int64)
+        self.halted = np.zeros(self.n, dtype=bool)
+
+    def set_keys(self, keys):
+        """Set the key currently pressed on each machine (0 for none)."""
+        self.ram[:, KBD] = keys
+
+    def instance(self, i: int) -> Emulator:
+        """A standalone Emulator holding a copy of machine 'i'."""
+        emu = Emulator(self.rom.tolist())
+        emu.ram = array('H', self.ram[i].tolist())
+        emu.a, emu.d, emu.pc = int(self.a[i]), int(self.d[i]), int(self.pc[i])
+        emu.cycles, emu.halted = int(self.cycles[i]), bool(self.halted[i])
+        return emu
+
+    def run(self, max_cycles: int) -> int:
+        """Advance every running machine by up to 'max_cycles' instructions.
+
+        Machines stop individually, setting 'halted', under the same
+        conditions as Emulator. Returns the number of steps taken, which
+        is less than 'max_cycles' only if every machine halted.
+        """
+        rows = np.arange(self.n)
+        rom_len = len(self.rom)
+        a, d, pc, ram = self.a, self.d, self.pc, self.ram
+        halted = self.halted | (pc >= rom_len)
+        for step in range(max_cycles):
+            if halted.any():
+                if halted.all():
+                    break
+            elif (pc == pc[0]).all():
+                # fast path: every machine is at the same instruction
+                a, d, pc, halt_loop = self._step_uniform(int(pc[0]), rows, a, d, pc)
+                self.cycles += 1
+                halted = halt_loop | (pc >= rom_len)
+                continue
+
+            running = ~halted
+            instr = self._rom[np.minimum(pc, rom_len)]
+            is_c = running & (instr & 0x8000 != 0)
+            is_a = running & ~is_c
+
+            addr = a & 0x7FFF
+            # ALU
+            x = d.copy()
+            y = np.where(instr & 0x1000 != 0, ram[rows, addr], a)
+            x[instr & 0x0800 != 0] = 0
+            x = np.where(instr & 0x0400 != 0, ~x, x)
+            y[instr & 0x0200 != 0] = 0
+            y = np.where(instr & 0x0100 != 0, ~y, y)
+            out = np.where(instr & 0x0080 != 0, x + y, x & y)
+            out = np.where(instr & 0x0040 != 0, ~out, out)
+
+            # writes, all from the pre-instruction A
+            write_m = is_c & (instr & 0x0008 != 0)
+            ram[rows[write_m], addr[write_m]] = out[write_m]
+            d = np.where(is_c & (instr & 0x0010 != 0), out, d)
+            new_a = np.where(is_c & (instr & 0x0020 != 0), out, a)
+            new_a = np.where(is_a, instr, new_a)
+
+            # jumps
+            signed = out.view(np.int16)
+            taken = is_c & (((instr & 0x4 != 0) & (signed < 0))
+                            | ((instr & 0x2 != 0) & (signed == 0))
+                            | ((instr & 0x1 != 0) & (signed > 0)))
+            halt_loop = (taken & (addr == pc - 1) & (instr & 0x0038 == 0)
+                         & (self._rom[np.minimum(addr, rom_len)] == addr))
+            pc = np.where(taken, addr, np.where(running, pc + 1, pc))
+            a = new_a
+            self.cycles += running
+            halted = halted | halt_loop | (pc >= rom_len)
+        else:
+            step = max_cycles
+        self.a, self.d, self.pc, self.halted = a, d, pc, halted
+        return step
+
+    def _step_uniform(self, pc0: int, rows, a, d, pc) -> tuple:
+        # execute ROM[pc0] on every machine, decoding it once. returns the
+        # new (a, d, pc) and which machines entered the halt loop.
+        word = int(self.rom[pc0])
+        if not word & 0x8000:
+            return np.full(self.n, word, dtype=np.uint16), d, pc + 1, self._none
+
+        addr = a & 0x7FFF
+        if word & 0x1000:
+            y = self.ram[rows, addr]
+        else:
+            y = a
+        x = d
+        if word & 0x0800: x = np.zeros(self.n, dtype=np.uint16)
+        if word & 0x0400: x = ~x
+        if word & 0x0200: y = np.zeros(self.n, dtype=np.uint16)
+        if word & 0x0100: y = ~y
+        out = x + y if word & 0x0080 else x & y
+        if word & 0x0040: out = ~out
+
+        if word & 0x0008:
+            self.ram[rows, addr] = out
+        if word & 0x0010:
+            d = out
+        new_a = out if word & 0x0020 else a
+
+        jump = word & 0x7
+        if not jump:
+            return new_a, d, pc + 1, self._none
+        signed = out.view(np.int16)
+        taken = np.zeros(self.n, dtype=bool)
+        if jump & 0x4: taken |= signed < 0
+        if jump & 0x2: taken |= signed == 0
+        if jump & 0x1: taken |= signed > 0
+        pc = np.where(taken, addr, pc + 1)
+        if not word & 0x0038 and pc0 > 0 and int(self.rom[pc0 - 1]) == pc0 - 1:
+            return new_a, d, pc, taken & (addr == pc0 - 1)
+        return new_a, d, pc, self._none
@@ -0,0 +1,188 @@
+import os
+from emulator import Emulator, load_rom, load_symbols, _comp_fn, SCREEN
+
+# 6 'c' bits -> Python expression of the ALU output, given x = d and 'y'
+_COMP_EXPR = {
+    0b101010 : '0',
+    0b111111 : '1',
+    0b111010 : '65535',
+    0b001100 : 'd',
+    0b110000 : '{y}',
+    0b001101 : 'd ^ 65535',
+    0b110001 : '{y} ^ 65535',
+    0b001111 : '-d & 65535',
+    0b110011 : '-{y} & 65535',
+    0b011111 : '(d + 1) & 65535',
+    0b110111 : '({y} + 1) & 65535',
+    0b001110 : '(d - 1) & 65535',
+    0b110010 : '({y} - 1) & 65535',
+    0b000010 : '(d + {y}) & 65535',
+    0b010011 : '(d - {y}) & 65535',
+    0b000111 : '({y} - d) & 65535',
+    0b000000 : 'd & {y}',
+    0b010101 : 'd | {y}',
+}
+
+# jump bits -> Python condition on the ALU output 'o'
+_JUMP_EXPR = (
+    None,
+    '0 < o < 32768',
+    'o == 0',
+    'o < 32768',
+    'o >= 32768',
+    'o != 0',
+    'o == 0 or o >= 32768',
+    'True',
+)
+
+# longest block to compile, in instructions
+MAX_BLOCK_LEN = 256
+
+
+class BlockJitEmulator(Emulator):
+    """Hack emulator that runs basic blocks as compiled Python functions.
+
+    A basic block starts at any address control reaches and runs up to and
+    including the first jump instruction, or up to the next label if the
+    assembler's labels are known. Each block is translated to the source of
+    one Python function, compile()d the first time it's reached, and cached
+    by start address. Inside a block the value of A is tracked while it's a
+    constant, so e.g. '@SP / M=M+1' compiles to 'ram[0] = (ram[0] + 1) & 65535'.
+
+    Behaves exactly like Emulator, including the cycle count. When fewer
+    cycles remain than the next block is long, the rest are interpreted.
+
+    Example usage:
+        emu = BlockJitEmulator.from_file('Prog.hack') # uses Prog.sym if present
+        emu.run(10_000_000)
+    """
+
+    def __init__(self, rom, symbols: dict = None):
+        """'rom' is an iterable of 16-bit instruction words. 'symbols' maps
+        labels to ROM addresses, as read by 'emulator.load_symbols()'."""
+        super().__init__(rom)
+        self._leaders = set(symbols.values()) if symbols else set()
+        self._blocks = {} # start address -> (function, length, halt address)
+
+    @classmethod
+    def from_file(cls, path: str):
+        sym_path = os.path.splitext(path)[0] + '.sym'
+        symbols = load_symbols(sym_path) if os.path.exists(sym_path) else None
+        return cls(load_rom(path), symbols)
+
+    def run(self, max_cycles: int, stop_pc: int = None) -> int:
+        """Execute up to 'max_cycles' instructions and return how many ran."""
+        blocks = self._blocks
+        ram = self.ram
+        a = self.a
+        d = self.d
+        pc = self.pc
+        n = 0
+        stopped = False
+        while True:
+            block = blocks.get(pc)
+            if block is None:
+                if pc >= len(self.rom):
+                    self.halted = True
+                    break
+                block = blocks[pc] = self._compile(pc)
+            fn, length, halt_pc = block
+            if n + length > max_cycles:
+                break
+            a, d, pc, jumped = fn(ram, a, d)
+            n += length
+            if pc == halt_pc:
+                self.halted = True
+                break
+            if jumped and pc == stop_pc:
+                stopped = True # the block ended in a taken jump to stop_pc
+                break
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += n
+        if not self.halted and not stopped and n < max_cycles:
+            n += super().run(max_cycles - n, stop_pc)
+        return n
+
+    def _compile(self, start: int) -> tuple:
+        # compile the block starting at 'start' into (function, length, halt address)
+        src, length, halt_pc = self.block_source(start)
+        namespace = {'_comp_fn' : _comp_fn, 'dirty' : self.screen_dirty}
+        exec(compile(src, f'<block {start}>', 'exec'), namespace)
+        return namespace['block'], length, halt_pc
+
+    def block_source(self, start: int) -> tuple:
+        """The Python source of the block starting at 'start'.
+
+        The function 'block(ram, a, d)' runs the block and returns (a, d,
+        next pc, whether it ended in a taken jump).
+
+        Returns (source, block length, halt address). If the block ends in
+        the canonical halt loop, '@X' at address X followed by a jump that
+        writes nothing, the halt address is X and the program halts when the
+        block returns X as the next pc. Otherwise it's None.
+        """
+        rom = self.rom
+        lines = ['def block(ram, a, d):']
+        ka = None # value of A, while it's a known constant
+        pc = start
+        end = None # source of the final return, if the block ends in a jump
+        while pc < len(rom) and pc - start < MAX_BLOCK_LEN:
+            if pc != start and pc in self._leaders:
+                break
+            word = rom[pc]
+            pc += 1
+            if not word & 0x8000:
+                ka = word
+                continue
+
+            code = (word >> 6) & 0x3F
+            read_m = word & 0x1000
+            write_a, write_d, write_m = word & 0x20, word & 0x10, word & 0x08
+            jump = word & 0x7
+
+            if ka is None and (read_m or write_m or jump):
+                lines.append('    m = a & 32767')
+            addr = str(ka & 0x7FFF) if ka is not None else 'm'
+            y = f'ram[{addr}]' if read_m else (str(ka) if ka is not None else 'a')
+            if code in _COMP_EXPR:
+                expr = _COMP_EXPR[code].format(y=y)
+            else:
+                # not in the spec: call the raw ALU
+                lines.insert(0, f'_alu_{code} = _comp_fn({code})')
+                expr = f'_alu_{code}(d, {y})'
+
+            dests = [f'ram[{addr}]'] * bool(write_m) + ['d'] * bool(write_d) + ['a'] * bool(write_a)
+            if len(dests) == 1 and not jump:
+                lines.append(f'    {dests[0]} = {expr}')
+            elif dests or jump != 0b111:
+                lines.append(f'    o = {expr}')
+                for dest in dests:
+                    lines.append(f'    {dest} = o')
+            if write_m and ka is None:
+                lines.append('    if m >= 16384: dirty[(m - 16384) >> 5] = 1')
+            elif write_m and ka & 0x7FFF >= SCREEN:
+                lines.append(f'    dirty[{((ka & 0x7FFF) - SCREEN) >> 5}] = 1')
+            if write_a:
+                ka = None
+
+            if jump:
+                target = addr
+                a_out = str(ka) if ka is not None else 'a'
+                if _JUMP_EXPR[jump] == 'True':
+                    end = [f'    return {a_out}, d, {target}, True']
+                else:
+                    end = [f'    if {_JUMP_EXPR[jump]}:',
+                           f'        return {a_out}, d, {target}, True',
+                           f'    return {a_out}, d, {pc}, False']
+                break
+
+        if end is None:
+            end = [f'    return {ka if ka is not None else "a"}, d, {pc}, False']
+        halt_pc = None
+        if (pc - start >= 2 and rom[pc - 2] == pc - 2
+                and rom[pc - 1] & 0x8038 == 0x8000 and rom[pc - 1] & 0x7 != 0):
+            halt_pc = pc - 2
+        src = '\n'.join(lines + end) + '\n'
+        return src, pc - start, halt_pc
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+"""Co-simulation of the gate-level CPU.hdl against the ISA emulator.
+
+The emulator runs the program one instruction at a time, recording every
+cycle's CPU state (A, D, PC) and inputs (instruction, inM), and what the
+CPU should do with them: writeM, addressM, outM and the next A, D and PC.
+Every cycle is then checked against CPU.hdl's netlist (see hdl_netlist.py),
+a whole batch at a time: test vector i of the bit-parallel evaluation is
+cycle i, with the CPU's DFFs set to the emulator's registers at that cycle.
+
+While the two agree, this is the same as running both in lockstep, and the
+first cycle that differs is reported with the cycles leading up to it.
+outM is only compared when writeM is set, as the CPU spec allows any value
+otherwise.
+
+Example usage:
+    cosim = CoSimulator.from_file('Prog.hack')
+    cosim.emu.ram[0] = 3 # set up inputs in the emulator as usual
+    divergence = cosim.run(1_000_000)
+    if divergence:
+        print(divergence.report())
+"""
+import sys
+from emulator import Emulator, load_rom
+from hdl_netlist import flatten
+from hdl_simulator import pack
+
+# 'M=A' and 'M=D', used to find the A and D registers' DFFs
+_M_EQ_A = 0b1110110000001000
+_M_EQ_D = 0b1110001100001000
+
+# fields compared every cycle
+FIELDS = ('writeM', 'addressM', 'outM', 'A', 'D', 'PC')
+
+
+class Divergence:
+    """The first cycle where CPU.hdl and the emulator differ."""
+
+    def __init__(self, cycle: int, state: tuple, mismatches: list, trace: list):
+        self.cycle = cycle
+        self.state = state          # (pc, instruction, A, D, inM) before the cycle
+        self.mismatches = mismatches # [(field, emulator value, CPU.hdl value)]
+        self.trace = trace          # states of the cycles before, oldest first
+
+    def report(self) -> str:
+        lines = [f"CPU.hdl diverges from the emulator at cycle {self.cycle}:",
+                 f"{'cycle':>10} {'PC':>6} {'instruction':>16} {'A':>6} {'D':>6} {'inM':>6}"]
+        start = self.cycle - len(self.trace)
+        for i, (pc, instr, a, d, in_m) in enumerate(self.trace + [self.state]):
+            marker = '  <--' if i == len(self.trace) else ''
+            lines.append(f"{start + i:>10} {pc:>6} {instr:016b} {a:>6} {d:>6} {in_m:>6}{marker}")
+        for field, expected, got in self.mismatches:
+            lines.append(f"    {field}: emulator {expected}, CPU.hdl {got}")
+        return '\n'.join(lines)
+
+
+class CoSimulator:
+    """Runs a program on the emulator, checking every cycle against CPU.hdl."""
+
+    def __init__(self, rom, netlist=None):
+        """'rom' is an iterable of 16-bit instruction words. 'netlist' is
+        the CPU's netlist, by default flatten('CPU')."""
+        self.emu = Emulator(rom)
+        self.netlist = netlist or flatten('CPU')
+        self._evaluate = self.netlist.compile()
+        pins = [pin for pin, _ in self.netlist.inputs]
+        if pins != ['inM', 'instruction', 'reset']:
+            raise ValueError(f"{self.netlist.name} doesn't have the CPU's pins")
+        self._offsets = {}
+        start = 0
+        for pin, nets in self.netlist.outputs:
+            self._offsets[pin] = start
+            start += len(nets)
+        self._state_start = start # DFF inputs follow the outputs
+        self._find_registers()
+
+    @classmethod
+    def from_file(cls, path: str):
+        return cls(load_rom(path))
+
+    def _find_registers(self):
+        # which DFF holds which bit of A, D and PC: set one DFF per vector
+        # and see which bit of outM (with 'M=A' or 'M=D') or pc follows it
+        n = len(self.netlist.dffs)
+        state = [1 << j for j in range(n)]
+        self.a_bits, self.d_bits, self.pc_bits = [None] * 16, [None] * 16, [None] * 16
+        for instruction, bits, pin in ((_M_EQ_A, self.a_bits, 'outM'),
+                                       (_M_EQ_D, self.d_bits, 'outM'),
+                                       (_M_EQ_A, self.pc_bits, 'pc')):
+            results = self._eval(n, [0] * 16 + pack([instruction] * n, 16) + [0], state)
+            start = self._offsets[pin]
+            width = len(dict(self.netlist.outputs)[pin])
+            for b in range(width):
+                lane = results[start + b]
+                if lane and lane & (lane - 1) == 0:
+                    bits[b] = lane.bit_length() - 1
+        # PC's top bit isn't an output: it's the one DFF left
+        rest = set(range(n)) - set(self.a_bits) - set(self.d_bits) - set(self.pc_bits)
+        if len(rest) == 1 and self.pc_bits[15] is None:
+            self.pc_bits[15] = rest.pop()
+        if None in self.a_bits + self.d_bits + self.pc_bits:
+            raise ValueError(f"can't find the A, D and PC registers of {self.netlist.name}")
+
+    def _eval(self, width: int, inputs: list, state: list) -> tuple:
+        return self._evaluate((1 << width) - 1, inputs + state, [])
+
+    def run(self, max_cycles: int, batch: int = 4096, context: int = 8):
+        """Run up to 'max_cycles' cycles, or until the program halts, and
+        return the first Divergence, or None if every cycle agreed. Checks
+        'batch' cycles per evaluation of the netlist and reports 'context'
+        cycles before a divergence."""
+        emu = self.emu
+        history = []
+        done = 0
+        while done < max_cycles and not emu.halted:
+            cycles = self._record(min(batch, max_cycles - done))
+            if not cycles:
+                break
+            found = self._check(cycles)
+            if found is not None:
+                i, mismatches = found
+                trace = (history + [c[:5] for c in cycles[:i]])[-context:] if context else []
+                return Divergence(emu.cycles - len(cycles) + i, cycles[i][:5], mismatches, trace)
+            history = (history + [c[:5] for c in cycles])[-context:]
+            done += len(cycles)
+        return None
+
+    def _record(self, n: int) -> list:
+        # step the emulator 'n' cycles: [(pc, instruction, A, D, inM, writeM,
+        # addressM, outM, next A, next D, next PC)]
+        emu = self.emu
+        rom, ram = emu.rom, emu.ram
+        cycles = []
+        for _ in range(n):
+            if emu.halted or emu.pc >= len(rom):
+                break
+            pc, a, d = emu.pc, emu.a, emu.d
+            instr = rom[pc]
+            addr = a & 0x7FFF
+            in_m = ram[addr]
+            emu.step()
+            write_m = int(instr & 0x8008 == 0x8008)
+            out_m = ram[addr] if write_m else 0
+            cycles.append((pc, instr, a, d, in_m, write_m, addr, out_m, emu.a, emu.d, emu.pc))
+        return cycles
+
+    def _check(self, cycles: list):
+        # evaluate CPU.hdl on every recorded cycle at once and compare lane
+        # by lane; returns (index, mismatches) of the first cycle that
+        # differs, or None
+        width = len(cycles)
+        pc, instr, a, d, in_m, write_m, address_m, out_m, next_a, next_d, next_pc = zip(*cycles)
+        state = [0] * len(self.netlist.dffs)
+        for bits, values in ((self.a_bits, a), (self.d_bits, d), (self.pc_bits, pc)):
+            for dff, lane in zip(bits, pack(values, 16)):
+                state[dff] = lane
+        results = self._eval(width, pack(in_m, 16) + pack(instr, 16) + [0], state)
+
+        def output(pin, bits):
+            start = self._offsets[pin]
+            return results[start:start + bits]
+        def register(bits):
+            return [results[self._state_start + dff] for dff in bits]
+        got = {
+            'writeM' : output('writeM', 1),
+            'addressM' : output('addressM', 15),
+            'outM' : output('outM', 16),
+            'A' : register(self.a_bits),
+            'D' : register(self.d_bits),
+            'PC' : register(self.pc_bits[:15]),
+        }
+        expected = {
+            'writeM' : pack(write_m, 1),
+            'addressM' : pack(address_m, 15),
+            'outM' : pack(out_m, 16),
+            'A' : pack(next_a, 16),
+            'D' : pack(next_d, 16),
+            'PC' : pack(next_pc, 15),
+        }
+        # outM only matters when writing
+        got['outM'] = [lane & expected['writeM'][0] for lane in got['outM']]
+        diff = 0
+        for field in FIELDS:
+            for x, y in zip(expected[field], got[field]):
+                diff |= x ^ y
+        if not diff:
+            return None
+        i = (diff & -diff).bit_length() - 1
+        mismatches = []
+        for field in FIELDS:
+            values = [sum((lane >> i & 1) << b for b, lane in enumerate(lanes))
+                      for lanes in (expected[field], got[field])]
+            if values[0] != values[1]:
+                mismatches.append((field, values[0], values[1]))
+        return i, mismatches
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description='Co-simulate CPU.hdl and the emulator')
+    argparser.add_argument('rom', help='path to a .hack or .hackb file')
+    argparser.add_argument('max_cycles', nargs='?', type=int, default=1_000_000)
+    argparser.add_argument('--batch', type=int, default=4096, help='cycles checked at once')
+    args = argparser.parse_args()
+
+    cosim = CoSimulator.from_file(args.rom)
+    divergence = cosim.run(args.max_cycles, args.batch)
+    if divergence:
+        print(divergence.report())
+        sys.exit(1)
+    print(f"{cosim.emu.cycles} cycles: CPU.hdl agrees with the emulator")
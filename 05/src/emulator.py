@@ -0,0 +1,323 @@
+#!/usr/bin/python3
+import sys
+import struct
+import hashlib
+import zlib
+from array import array
+
+RAM_SIZE = 32768
+SCREEN = 16384
+KBD = 24576
+
+# snapshot header: magic, version, sha256 of the ROM, A, D, PC, cycles, halted
+SNAPSHOT_MAGIC = b'HSNP'
+SNAPSHOT_VERSION = 1
+_SNAPSHOT_HEADER = struct.Struct('<4sH32sHHIQ?')
+
+# comp bits 'accccc c' (a bit included) -> f(D, A or M) in [0, 0xFFFF]
+_COMP = {
+    0b0101010 : lambda x, y: 0,
+    0b0111111 : lambda x, y: 1,
+    0b0111010 : lambda x, y: 0xFFFF,
+    0b0001100 : lambda x, y: x,
+    0b0110000 : lambda x, y: y,
+    0b0001101 : lambda x, y: x ^ 0xFFFF,
+    0b0110001 : lambda x, y: y ^ 0xFFFF,
+    0b0001111 : lambda x, y: -x & 0xFFFF,
+    0b0110011 : lambda x, y: -y & 0xFFFF,
+    0b0011111 : lambda x, y: (x + 1) & 0xFFFF,
+    0b0110111 : lambda x, y: (y + 1) & 0xFFFF,
+    0b0001110 : lambda x, y: (x - 1) & 0xFFFF,
+    0b0110010 : lambda x, y: (y - 1) & 0xFFFF,
+    0b0000010 : lambda x, y: (x + y) & 0xFFFF,
+    0b0010011 : lambda x, y: (x - y) & 0xFFFF,
+    0b0000111 : lambda x, y: (y - x) & 0xFFFF,
+    0b0000000 : lambda x, y: x & y,
+    0b0010101 : lambda x, y: x | y,
+}
+# the 'M' forms compute the same function, with y = M
+_COMP.update({code | 0b1000000 : f for code, f in list(_COMP.items())})
+
+# jump bits -> f(out), or None for no jump
+_JUMP = (
+    None,
+    lambda out: 0 < out < 0x8000,   # JGT
+    lambda out: out == 0,           # JEQ
+    lambda out: out < 0x8000,       # JGE
+    lambda out: out >= 0x8000,      # JLT
+    lambda out: out != 0,           # JNE
+    lambda out: out == 0 or out >= 0x8000, # JLE
+    lambda out: True,               # JMP
+)
+
+def alu(x: int, y: int, zx, nx, zy, ny, f, no) -> int:
+    """The Hack ALU on 16-bit unsigned operands, straight from the control bits.
+    Used for comp codes that aren't in the Hack assembly spec."""
+    if zx: x = 0
+    if nx: x ^= 0xFFFF
+    if zy: y = 0
+    if ny: y ^= 0xFFFF
+    out = (x + y) & 0xFFFF if f else x & y
+    return out ^ 0xFFFF if no else out
+
+def _comp_fn(code: int):
+    # the function for 7-bit comp 'code', falling back to the raw ALU
+    if code in _COMP:
+        return _COMP[code]
+    bits = [(code >> i) & 1 for i in range(5, -1, -1)]
+    return lambda x, y: alu(x, y, *bits)
+
+def decode(word: int):
+    """Predecode one instruction for the run loop.
+
+    A-instructions decode to their (int) value. C-instructions decode to a
+    tuple (comp function, reads M?, writes A?, writes D?, writes M?, jump
+    function or None).
+    """
+    if not word & 0x8000:
+        return word
+    return (_comp_fn((word >> 6) & 0x7F),
+            bool(word & 0x1000),
+            bool(word & 0x20),
+            bool(word & 0x10),
+            bool(word & 0x08),
+            _JUMP[word & 0x7])
+
+def load_rom(path: str) -> array:
+    """Read a .hack text file or a .hackb file (see 06/src/hack_binary.py)
+    into an array('H') of words."""
+    with open(path, 'rb') as f:
+        head = f.read(8)
+        if head[:4] == b'HACK':
+            (n_words,) = struct.unpack('<I', head[4:])
+            words = array('H')
+            words.fromfile(f, n_words)
+            if sys.byteorder != 'little':
+                words.byteswap()
+            return words
+        text = head + f.read()
+    return array('H', (int(line, 2) for line in text.split() if line))
+
+def load_symbols(path: str) -> dict:
+    """Read a .sym file written by the assembler's --symbols option into a
+    dict of label -> ROM address."""
+    symbols = {}
+    with open(path, 'r', encoding=None) as f:
+        for line in f:
+            addr, label = line.split()
+            symbols[label] = int(addr)
+    return symbols
+
+
+class Emulator:
+    """Instruction-level emulator of the Hack computer.
+
+    The ROM is predecoded once, and RAM is a 32K array('H') of words, so the
+    run loop does no string work and allocates nothing per cycle. Writes to
+    RAM[KBD] are ignored by programs in practice; set the keyboard with
+    'set_key()'.
+
+    Example usage:
+        emu = Emulator.from_file('Prog.hack')
+        emu.run(1_000_000) # cycles executed, stops early at the final
+                           # infinite loop '(END) @END 0;JMP'
+        emu.ram[256], emu.a, emu.d, emu.pc, emu.cycles
+
+    Snapshots save the whole machine state, so long scenarios can start
+    from a checkpoint instead of re-running the OS boot:
+        main = load_symbols('Prog.sym')['Main.main']
+        emu.checkpoint('Prog.snap', main, 10_000_000) # runs Sys.init once
+    """
+
+    def __init__(self, rom):
+        """'rom' is an iterable of 16-bit instruction words."""
+        self.rom = array('H', rom)
+        self._decoded = [decode(word) for word in self.rom]
+        self.ram = array('H', bytes(2 * RAM_SIZE))
+        # screen_dirty[r] is set when screen row r is written. writes above
+        # the screen land in entries 256-511, which are never read.
+        self.screen_dirty = bytearray((RAM_SIZE - SCREEN) // 32)
+        self.reset()
+
+    @classmethod
+    def from_file(cls, path: str):
+        return cls(load_rom(path))
+
+    def reset(self):
+        """Reset the CPU, as with the 'reset' pin. RAM is left untouched."""
+        self.a = 0
+        self.d = 0
+        self.pc = 0
+        self.cycles = 0
+        self.halted = False
+
+    def rom_hash(self) -> bytes:
+        """SHA-256 of the ROM words, identifying the program a snapshot
+        belongs to."""
+        words = array('H', self.rom)
+        if sys.byteorder != 'little':
+            words.byteswap()
+        return hashlib.sha256(words.tobytes()).digest()
+
+    def snapshot(self) -> bytes:
+        """The machine state as bytes: a fixed header (ROM hash, A, D, PC,
+        cycle count, halted) followed by the zlib-compressed RAM. Mostly
+        empty RAM compresses to a few KB."""
+        ram = array('H', self.ram)
+        if sys.byteorder != 'little':
+            ram.byteswap()
+        header = _SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.rom_hash(),
+                                       self.a, self.d, self.pc, self.cycles, self.halted)
+        return header + zlib.compress(ram.tobytes(), 1)
+
+    def restore(self, data: bytes):
+        """Restore the state saved by 'snapshot()'. Raises ValueError if
+        'data' isn't a snapshot or was taken with a different ROM.
+
+        RAM is copied into the existing array, so memoryviews of it (see
+        framebuffer.py) stay valid; every screen row is marked dirty.
+        """
+        if len(data) < _SNAPSHOT_HEADER.size:
+            raise ValueError('not a Hack snapshot')
+        magic, version, rom_hash, a, d, pc, cycles, halted = \
+            _SNAPSHOT_HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError('not a Hack snapshot')
+        if rom_hash != self.rom_hash():
+            raise ValueError('snapshot was taken with a different ROM')
+        ram = array('H', zlib.decompress(data[_SNAPSHOT_HEADER.size:]))
+        if len(ram) != RAM_SIZE:
+            raise ValueError('truncated snapshot')
+        if sys.byteorder != 'little':
+            ram.byteswap()
+        self.ram[:] = ram
+        self.screen_dirty[:] = b'\x01' * len(self.screen_dirty)
+        self.a, self.d, self.pc, self.cycles, self.halted = a, d, pc, cycles, halted
+
+    def save_snapshot(self, path: str):
+        with open(path, 'wb') as f:
+            f.write(self.snapshot())
+
+    def load_snapshot(self, path: str):
+        with open(path, 'rb') as f:
+            self.restore(f.read())
+
+    def checkpoint(self, path: str, stop_pc: int, max_cycles: int) -> bool:
+        """Fast-forward to a checkpoint: restore the snapshot at 'path' if
+        it exists and matches the ROM, otherwise run until the program jumps
+        to 'stop_pc' (e.g. the address of 'Main.main' from the .sym file)
+        and save a snapshot there. Returns True if 'stop_pc' was reached.
+        """
+        try:
+            self.load_snapshot(path)
+            return self.pc == stop_pc
+        except (OSError, ValueError):
+            pass
+        self.run(max_cycles, stop_pc)
+        if self.pc != stop_pc:
+            return False
+        self.save_snapshot(path)
+        return True
+
+    def set_key(self, key: int):
+        """Set the key currently pressed (0 for none)."""
+        self.ram[KBD] = key
+
+    def step(self):
+        """Execute one instruction."""
+        self.run(1)
+
+    # subclasses may define _on_jump(source, target, n), called after every
+    # taken jump except into the halt loop, with 'n' the cycles run so far
+    # by this run(); returning True stops the run there
+    _on_jump = None
+
+    def run(self, max_cycles: int, stop_pc: int = None) -> int:
+        """Execute up to 'max_cycles' instructions and return how many ran.
+
+        Stops early, setting 'halted', if the program jumps to an address
+        outside the ROM or enters the canonical halt loop: an '@X' at
+        address X followed by an unconditional jump back to it. Also stops,
+        without halting, right after a jump to 'stop_pc'.
+        """
+        rom = self._decoded
+        ram = self.ram
+        dirty = self.screen_dirty
+        on_jump = self._on_jump
+        a = self.a
+        d = self.d
+        pc = self.pc
+        n = 0
+        try:
+            while n < max_cycles:
+                instr = rom[pc]
+                n += 1
+                if instr.__class__ is int:
+                    a = instr
+                    pc += 1
+                    continue
+                comp, read_m, write_a, write_d, write_m, jump = instr
+                addr = a & 0x7FFF
+                out = comp(d, ram[addr] if read_m else a)
+                if write_m:
+                    ram[addr] = out
+                    if addr >= SCREEN:
+                        dirty[(addr - SCREEN) >> 5] = 1
+                if write_d:
+                    d = out
+                if write_a:
+                    a = out
+                if jump is not None and jump(out):
+                    if addr == pc - 1 and rom[addr] == addr and not (write_a or write_d or write_m):
+                        pc = addr
+                        self.halted = True
+                        break
+                    if on_jump is not None and on_jump(pc, addr, n):
+                        pc = addr
+                        break
+                    pc = addr
+                    if addr == stop_pc:
+                        break
+                else:
+                    pc += 1
+        except IndexError:
+            # ran off the end of the ROM
+            self.halted = True
+        self.a = a
+        self.d = d
+        self.pc = pc
+        self.cycles += n
+        return n
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description='Hack computer emulator')
+    argparser.add_argument('rom', help='path to a .hack or .hackb file')
+    argparser.add_argument('max_cycles', nargs='?', type=int, default=10_000_000)
+    argparser.add_argument('--jit', action='store_true',
+                           help='compile basic blocks to Python (uses Prog.sym if present)')
+    argparser.add_argument('--skip-idle', action='store_true',
+                           help='skip idle loops, such as Sys.wait and keyboard polling')
+    argparser.add_argument('--key', action='append', default=[], metavar='CYCLE:CODE',
+                           help='press key CODE (0 to release) at CYCLE; implies --skip-idle')
+    argparser.add_argument('--load', metavar='PATH', help='start from a saved snapshot')
+    argparser.add_argument('--save', metavar='PATH', help='save a snapshot when done')
+    args = argparser.parse_args()
+
+    if args.skip_idle or args.key:
+        from idle_skip import IdleSkippingEmulator
+        emu = IdleSkippingEmulator.from_file(args.rom)
+        emu.script_keys(tuple(map(int, key.split(':'))) for key in args.key)
+    elif args.jit:
+        from block_jit import BlockJitEmulator
+        emu = BlockJitEmulator.from_file(args.rom)
+    else:
+        emu = Emulator.from_file(args.rom)
+    if args.load:
+        emu.load_snapshot(args.load)
+    emu.run(args.max_cycles)
+    if args.save:
+        emu.save_snapshot(args.save)
+    print(f"cycles={emu.cycles} halted={emu.halted} A={emu.a} D={emu.d} PC={emu.pc}")
+    print('RAM[0:16] =', list(emu.ram[:16]))
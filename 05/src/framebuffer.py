@@ -0,0 +1,116 @@
+"""Headless view of an emulated Hack screen.
+
+The screen is RAM[16384:24576]: 256 rows of 32 words, where bit i of word
+c of a row is pixel 16 * c + i, and 1 is black. A Framebuffer views that
+memory in place and renders only the rows written since the last frame,
+using the emulator's 'screen_dirty' flags.
+
+'image()' requires NumPy; everything else uses only the standard library.
+
+Example usage:
+    emu = Emulator.from_file('Pong.hack')
+    fb = Framebuffer(emu)
+    for i in range(100):
+        emu.run(200_000)
+        fb.save_png(f'frame{i:03}.png') # only re-encodes dirty rows
+"""
+import struct
+import sys
+import zlib
+from emulator import SCREEN, KBD
+
+HEIGHT = 256
+WIDTH = 512
+ROW_WORDS = WIDTH // 16
+
+# byte -> the same 8 pixels as a PNG greyscale byte: bit order reversed
+# (leftmost pixel in the high bit) and inverted (1 is white)
+_PNG_BYTE = bytes((~int(f'{b:08b}'[::-1], 2)) & 0xFF for b in range(256))
+
+class Framebuffer:
+    """Zero-copy view of an emulator's screen memory."""
+
+    def __init__(self, emu):
+        """'emu' is an Emulator (or subclass); its RAM is viewed, not copied."""
+        self._emu = emu
+        self._image = None     # last rendered image (NumPy)
+        self._png_rows = None  # last encoded PNG rows
+        self._dirty_image = bytearray(b'\x01' * HEIGHT)
+        self._dirty_png = bytearray(b'\x01' * HEIGHT)
+
+    def words(self) -> memoryview:
+        """The 8K screen words as a memoryview into the emulator's RAM."""
+        return memoryview(self._emu.ram)[SCREEN:KBD]
+
+    def array(self):
+        """The 8K screen words as a NumPy uint16 view of the emulator's RAM."""
+        import numpy as np
+        return np.frombuffer(self._emu.ram, dtype=np.uint16, count=KBD - SCREEN,
+                             offset=SCREEN * 2)
+
+    def dirty_rows(self) -> list:
+        """Rows written since the last frame was rendered, by 'image()' or
+        'save_png()', or since the last 'clear_dirty()'."""
+        self._collect_dirty()
+        return [r for r in range(HEIGHT) if self._dirty_image[r] or self._dirty_png[r]]
+
+    def clear_dirty(self):
+        """Forget which rows were written."""
+        self._collect_dirty()
+        self._dirty_image[:] = bytes(HEIGHT)
+        self._dirty_png[:] = bytes(HEIGHT)
+
+    def image(self):
+        """The screen as a 256 x 512 NumPy uint8 array of 0/1 pixels
+        (1 is black). Only rows written since the last call are unpacked;
+        the returned array is reused between calls."""
+        import numpy as np
+        self._collect_dirty()
+        if self._image is None:
+            self._image = np.zeros((HEIGHT, WIDTH), dtype=np.uint8)
+        rows = np.flatnonzero(np.frombuffer(self._dirty_image, dtype=np.uint8))
+        if len(rows):
+            words = self.array().reshape(HEIGHT, ROW_WORDS)[rows]
+            bits = words.astype('<u2').view(np.uint8)
+            self._image[rows] = np.unpackbits(bits, axis=1, bitorder='little')
+            self._dirty_image[:] = bytes(HEIGHT)
+        return self._image
+
+    def save_png(self, path: str):
+        """Write the screen to 'path' as a 1-bit greyscale PNG. Only rows
+        written since the last call are re-encoded."""
+        self._collect_dirty()
+        if self._png_rows is None:
+            self._png_rows = [b''] * HEIGHT
+        screen = self.words().cast('B')
+        for r in range(HEIGHT):
+            if self._dirty_png[r]:
+                # pixel order needs the low byte of each word first
+                row = screen[r * ROW_WORDS * 2:(r + 1) * ROW_WORDS * 2].tobytes()
+                if sys.byteorder != 'little':
+                    row = b''.join(row[i + 1:i + 2] + row[i:i + 1] for i in range(0, len(row), 2))
+                self._png_rows[r] = b'\x00' + row.translate(_PNG_BYTE)
+        self._dirty_png[:] = bytes(HEIGHT)
+        write_png(path, b''.join(self._png_rows))
+
+    def _collect_dirty(self):
+        # move the emulator's dirty flags into each consumer's own flags
+        dirty = self._emu.screen_dirty
+        for r in range(HEIGHT):
+            if dirty[r]:
+                self._dirty_image[r] = 1
+                self._dirty_png[r] = 1
+        dirty[:HEIGHT] = bytes(HEIGHT)
+
+
+def write_png(path: str, raw: bytes):
+    """Write filtered 1-bit greyscale scanlines 'raw' (each prefixed with its
+    filter byte) as a 512 x 256 PNG."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return (struct.pack('>I', len(data)) + kind + data
+                + struct.pack('>I', zlib.crc32(kind + data)))
+    with open(path, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', WIDTH, HEIGHT, 1, 0, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw)))
+        f.write(chunk(b'IEND', b''))
@@ -0,0 +1,554 @@
+"""Flattening of nand2tetris HDL chips into optimized gate-level netlists.
+
+Each chip is flattened once into a netlist of Nand gates, DFFs and built-in
+memory chips, with its pins as the netlist's inputs and outputs, and
+optimized:
+- constant propagation: a Nand with a 'false' input is 'true', one with a
+  'true' input is a Not, and 'x & !x' is 'false'
+- structural hashing: gates with the same inputs are merged, so the 16
+  copies of 'Not (in=sel)' in a Mux16 become one, and 'Not (Not x)' is x
+- dead-gate elimination: gates that no output, DFF or memory depends on
+  are dropped
+A chip that uses another chip instantiates the other chip's optimized
+netlist, renumbering its nets, instead of expanding it from the HDL again,
+and is then optimized again, now that constants from its own wiring are
+known (e.g. PC ties 5 inputs of an Or8Way to 'false').
+
+Netlists are memoized by a hash of the chip's .hdl file and, recursively,
+of the chips it uses, in memory and in an on-disk cache, along with the
+compiled Python code of the chips flattened at the top level. A warm run
+only parses the .hdl files to compute the hashes.
+
+Example usage:
+    net = flatten('Computer') # reads ~/.cache/hack-hdl on the second run
+    net.gate_count(), len(net.dffs), net.depth()
+"""
+import hashlib
+import marshal
+import os
+import sys
+from hdl_parser import ChipDef, find_hdl, parse
+
+FALSE = 0
+TRUE = 1
+
+# chips that are primitives of the netlist: name -> (inputs, outputs)
+BUILTIN_PINS = {
+    'Nand' : ([('a', 1), ('b', 1)], [('out', 1)]),
+    'DFF' : ([('in', 1)], [('out', 1)]),
+    'RAM16K' : ([('in', 16), ('load', 1), ('address', 14)], [('out', 16)]),
+    'Screen' : ([('in', 16), ('load', 1), ('address', 13)], [('out', 16)]),
+    'Keyboard' : ([], [('out', 16)]),
+    'ROM32K' : ([('address', 15)], [('out', 16)]),
+}
+# chips that are built in to the Java simulator, built here from another chip
+ALIASES = {'ARegister' : 'Register', 'DRegister' : 'Register'}
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hack-hdl')
+# bump when the netlist format or the optimizer changes
+CACHE_VERSION = 1
+
+# in-memory cache: chip hash -> Netlist
+_netlists = {}
+
+
+class Netlist:
+    """A flattened chip.
+
+    Nets are numbered from 0; net 0 is 'false' and net 1 is 'true'.
+    - inputs, outputs: [(pin, [net per bit])]
+    - signals: internal signal of the top chip -> [net per bit]
+    - nodes: in evaluation order, ('nand', out, a, b) or ('read', k) for
+      the combinational read of memories[k]
+    - dffs: [(path, out net, in net)]
+    - memories: [(chip, path, address nets, in nets, load net, out nets)]
+    """
+
+    def __init__(self, name, inputs, outputs, signals, nodes, dffs, memories, n_nets):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.signals = signals
+        self.nodes = nodes
+        self.dffs = dffs
+        self.memories = memories
+        self.n_nets = n_nets
+        self._producers = None # net -> nets it's computed from
+        self._code_path = None # where flatten() caches the compiled code
+
+    def gate_count(self) -> int:
+        return sum(node[0] == 'nand' for node in self.nodes)
+
+    def depth(self) -> int:
+        """Nand gates on the longest combinational path."""
+        level = [0] * self.n_nets
+        for node in self.nodes:
+            if node[0] == 'nand':
+                _, out, a, b = node
+                level[out] = max(level[a], level[b]) + 1
+            else:
+                _, _, address, _, _, outs = self.memories[node[1]]
+                deepest = max((level[n] for n in address), default=0)
+                for n in outs:
+                    level[n] = deepest
+        return max(level, default=0)
+
+    def sources(self) -> list:
+        """Nets set from outside each evaluation: the input bits, in pin
+        order, then the DFF outputs."""
+        return [n for _, nets in self.inputs for n in nets] + [q for _, q, _ in self.dffs]
+
+    def results(self) -> list:
+        """Nets returned by each evaluation: the output bits, in pin order,
+        then the DFF inputs, then for each RAM16K or Screen its in, load and
+        address bits."""
+        nets = [n for _, nets in self.outputs for n in nets] + [d for _, _, d in self.dffs]
+        for chip, _, address, data_in, load, _ in self.memories:
+            if chip in ('RAM16K', 'Screen'):
+                nets += data_in + [load] + address
+        return nets
+
+    def source(self) -> str:
+        """The Python source of 'evaluate(M, sources, mems)', which returns
+        the lanes of 'results()' given the lanes of 'sources()'. M is the
+        all-ones lane, and mems[k] reads memories[k]."""
+        def lane(net):
+            return '0' if net == FALSE else 'M' if net == TRUE else f'n{net}'
+        def lanes(nets):
+            return ''.join(f'{lane(n)}, ' for n in nets)
+        lines = ['def evaluate(M, sources, mems):']
+        sources = self.sources()
+        if sources:
+            lines.append(f'    {lanes(sources)}= sources')
+        for node in self.nodes:
+            if node[0] == 'nand':
+                _, out, a, b = node
+                lines.append(f'    n{out} = M ^ ({lane(a)} & {lane(b)})')
+            else:
+                _, _, address, _, _, outs = self.memories[node[1]]
+                lines.append(f'    {lanes(outs)}= mems[{node[1]}]({lanes(address)})')
+        lines.append(f'    return ({lanes(self.results())})')
+        return '\n'.join(lines) + '\n'
+
+    def compile(self):
+        """The compiled 'evaluate()' function, see 'source()'."""
+        code = _read_cache(self._code_path)
+        if code is None:
+            code = compile(self.source(), f'<netlist {self.name}>', 'exec')
+            _write_cache(self._code_path, code)
+        namespace = {}
+        exec(code, namespace)
+        return namespace['evaluate']
+
+    def to_tuple(self) -> tuple:
+        return (self.name, self.inputs, self.outputs, self.signals, self.nodes,
+                self.dffs, self.memories, self.n_nets)
+
+    def cone(self, net: int) -> set:
+        """The source nets (see 'sources()') that 'net' depends on."""
+        if self._producers is None:
+            self._producers = {}
+            for node in self.nodes:
+                if node[0] == 'nand':
+                    self._producers[node[1]] = node[2:]
+                else:
+                    _, _, address, _, _, outs = self.memories[node[1]]
+                    for n in outs:
+                        self._producers[n] = address
+        producers = self._producers
+        result = set()
+        seen = set()
+        todo = [net]
+        while todo:
+            n = todo.pop()
+            if n in seen:
+                continue
+            seen.add(n)
+            if n in producers:
+                todo.extend(producers[n])
+            elif n > TRUE:
+                result.add(n)
+        return result
+
+
+
+class _Builder:
+    # the nets of one chip being flattened: instantiates the netlists of its
+    # parts, merging the nets joined by output pins with a union-find
+
+    def __init__(self):
+        self.parent = [FALSE, TRUE]
+        self.nodes = []
+        self.dffs = []
+        self.memories = []
+
+    def new_net(self) -> int:
+        self.parent.append(len(self.parent))
+        return len(self.parent) - 1
+
+    def find(self, net: int) -> int:
+        root = net
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[net] != root:
+            self.parent[net], net = root, self.parent[net]
+        return root
+
+    def union(self, a: int, b: int):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+    def instantiate(self, sub: Netlist, inputs: dict, prefix: str) -> dict:
+        # add a copy of 'sub' whose input pins read the nets 'inputs';
+        # returns its output pin -> nets
+        nets = {FALSE : FALSE, TRUE : TRUE}
+        for pin, sub_nets in sub.inputs:
+            nets.update(zip(sub_nets, inputs[pin]))
+        def net(n):
+            if n not in nets:
+                nets[n] = self.new_net()
+            return nets[n]
+        offset = len(self.memories)
+        for node in sub.nodes:
+            if node[0] == 'nand':
+                self.nodes.append(('nand', net(node[1]), net(node[2]), net(node[3])))
+            else:
+                self.nodes.append(('read', node[1] + offset))
+        for path, q, d in sub.dffs:
+            self.dffs.append((f'{prefix}/{path}' if path else prefix, net(q), net(d)))
+        for chip, path, address, data_in, load, out in sub.memories:
+            self.memories.append((chip, f'{prefix}/{path}' if path else prefix,
+                                  [net(n) for n in address], [net(n) for n in data_in],
+                                  net(load), [net(n) for n in out]))
+        return {pin : [net(n) for n in sub_nets] for pin, sub_nets in sub.outputs}
+
+
+class _Flattener:
+    # builds, or finds in the caches, the netlist of each chip
+
+    def __init__(self, path, cache_dir):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.defs = {}
+        self.keys = {}
+
+    def key(self, name: str) -> str:
+        """Hash of the chip's HDL and of the chips it uses."""
+        name = ALIASES.get(name, name)
+        if name not in self.keys:
+            if name in BUILTIN_PINS:
+                inputs, outputs = BUILTIN_PINS[name]
+                self.defs[name] = ChipDef(name, inputs, outputs, [], builtin=name)
+                data = b'builtin'
+            else:
+                filepath = find_hdl(name, self.path)
+                with open(filepath, 'rb') as f:
+                    data = f.read()
+                try:
+                    self.defs[name] = parse(data.decode())
+                except ValueError as e:
+                    raise ValueError(f"{filepath}: {e}") from None
+                for part in dict.fromkeys(part for part, _ in self.defs[name].parts):
+                    data += self.key(part).encode()
+            header = f'{CACHE_VERSION} {name} '.encode()
+            self.keys[name] = hashlib.sha256(header + data).hexdigest()
+        return self.keys[name]
+
+    def chip(self, name: str) -> ChipDef:
+        self.key(name)
+        return self.defs[ALIASES.get(name, name)]
+
+    def netlist(self, name: str) -> Netlist:
+        key = self.key(name)
+        if key not in _netlists:
+            cache_path = os.path.join(self.cache_dir, key) if self.cache_dir else None
+            cached = _read_cache(cache_path and cache_path + '.net')
+            if cached is not None:
+                net = Netlist(*cached)
+            else:
+                net = self.build(name)
+                _write_cache(cache_path and cache_path + '.net', net.to_tuple())
+            if cache_path:
+                net._code_path = f'{cache_path}.{sys.implementation.cache_tag}.code'
+            _netlists[key] = net
+        return _netlists[key]
+
+    def build(self, name: str) -> Netlist:
+        chip = self.chip(name)
+        name = chip.name
+        if chip.builtin:
+            return _primitive(chip)
+        b = _Builder()
+        bindings = {pin : [b.new_net() for _ in range(width)]
+                    for pin, width in chip.inputs + chip.outputs}
+
+        # internal signals take the width of the output pins driving them
+        signals = dict(bindings)
+        widths = {}
+        for part, connections in chip.parts:
+            outputs = dict(self.chip(part).outputs)
+            for c in connections:
+                if c.pin in outputs and c.signal not in signals:
+                    width = c.pin_hi - c.pin_lo + 1 if c.pin_lo is not None else outputs[c.pin]
+                    widths[c.signal] = max(widths.get(c.signal, 0), width)
+        for signal, width in widths.items():
+            signals[signal] = [b.new_net() for _ in range(width)]
+
+        for i, (part, connections) in enumerate(chip.parts):
+            sub = self.chip(part)
+            pins = sub.pins()
+            outputs = dict(sub.outputs)
+            child = {pin : [FALSE] * width for pin, width in sub.inputs}
+            driven = [] # (pin, first bit, parent nets)
+            for c in connections:
+                if c.pin not in pins:
+                    raise ValueError(f"{name}: {part} has no pin '{c.pin}'")
+                lo, hi = (c.pin_lo, c.pin_hi) if c.pin_lo is not None else (0, pins[c.pin] - 1)
+                if c.signal in ('true', 'false'):
+                    nets = [TRUE if c.signal == 'true' else FALSE] * (hi - lo + 1)
+                elif c.signal in signals:
+                    nets = signals[c.signal]
+                    if c.sig_lo is not None:
+                        nets = nets[c.sig_lo:c.sig_hi + 1]
+                else:
+                    raise ValueError(f"{name}: signal '{c.signal}' is never driven")
+                if len(nets) != hi - lo + 1 or hi >= pins[c.pin]:
+                    raise ValueError(f"{name}: width mismatch in {part} ({c.pin}={c.signal})")
+                if c.pin in outputs:
+                    if c.signal in ('true', 'false') or c.signal in dict(chip.inputs):
+                        raise ValueError(f"{name}: {part} output '{c.pin}' drives '{c.signal}'")
+                    driven.append((c.pin, lo, nets))
+                else:
+                    child[c.pin][lo:hi + 1] = nets
+            sub_outputs = b.instantiate(self.netlist(part), child, f'{part}:{i}')
+            for pin, lo, nets in driven:
+                for k, net in enumerate(nets):
+                    b.union(sub_outputs[pin][lo + k], net)
+
+        return _optimize(_finish(name, b, [(pin, bindings[pin]) for pin, _ in chip.inputs],
+                                 [(pin, bindings[pin]) for pin, _ in chip.outputs],
+                                 {s : signals[s] for s in widths}))
+
+
+def _primitive(chip: ChipDef) -> Netlist:
+    # the netlist of a built-in chip
+    n_nets = 2
+    pins = {}
+    for pin, width in chip.inputs + chip.outputs:
+        pins[pin] = list(range(n_nets, n_nets + width))
+        n_nets += width
+    inputs = [(pin, pins[pin]) for pin, _ in chip.inputs]
+    outputs = [(pin, pins[pin]) for pin, _ in chip.outputs]
+    nodes, dffs, memories = [], [], []
+    if chip.name == 'Nand':
+        nodes.append(('nand', pins['out'][0], pins['a'][0], pins['b'][0]))
+    elif chip.name == 'DFF':
+        dffs.append(('', pins['out'][0], pins['in'][0]))
+    else:
+        load = pins['load'][0] if 'load' in pins else FALSE
+        memories.append((chip.name, '', pins.get('address', []), pins.get('in', []),
+                         load, pins['out']))
+        nodes.append(('read', 0))
+    return Netlist(chip.name, inputs, outputs, {}, nodes, dffs, memories, n_nets)
+
+def _finish(name: str, b: _Builder, inputs: list, outputs: list, signals: dict) -> Netlist:
+    # number the merged nets of a built chip and order its nodes. nets
+    # nothing drives read as false
+    driven = {FALSE, TRUE}
+    def drive(net):
+        net = b.find(net)
+        if net in driven:
+            raise ValueError(f"{name}: a signal has more than one driver")
+        driven.add(net)
+    for _, nets in inputs:
+        for net in nets:
+            drive(net)
+    for node in b.nodes:
+        if node[0] == 'nand':
+            drive(node[1])
+    for _, q, _ in b.dffs:
+        drive(q)
+    for memory in b.memories:
+        for net in memory[5]:
+            drive(net)
+
+    number = {FALSE : FALSE, TRUE : TRUE}
+    def net_id(net):
+        net = b.find(net)
+        if net not in driven:
+            return FALSE
+        if net not in number:
+            number[net] = len(number)
+        return number[net]
+    def net_ids(nets):
+        return [net_id(n) for n in nets]
+    inputs = [(pin, net_ids(nets)) for pin, nets in inputs]
+    outputs = [(pin, net_ids(nets)) for pin, nets in outputs]
+    signals = {s : net_ids(nets) for s, nets in signals.items()}
+    nodes = []
+    for node in b.nodes:
+        if node[0] == 'nand':
+            nodes.append(('nand', net_id(node[1]), net_id(node[2]), net_id(node[3])))
+        else:
+            nodes.append(node)
+    dffs = [(path, net_id(q), net_id(d)) for path, q, d in b.dffs]
+    memories = [(chip, path, net_ids(address), net_ids(data_in), net_id(load), net_ids(out))
+                for chip, path, address, data_in, load, out in b.memories]
+    nodes = _levelize(name, nodes, memories, {n for _, nets in inputs for n in nets}
+                      | {q for _, q, _ in dffs})
+    return Netlist(name, inputs, outputs, signals, nodes, dffs, memories, len(number))
+
+def _levelize(name: str, nodes: list, memories: list, sources: set) -> list:
+    # order gates and memory reads so each comes after the nodes it reads
+    def reads(node):
+        return node[2:] if node[0] == 'nand' else memories[node[1]][2]
+    def writes(node):
+        return node[1:2] if node[0] == 'nand' else memories[node[1]][5]
+    ready = set(sources) | {FALSE, TRUE}
+    waiting = {} # net -> indices of nodes waiting for it
+    pending = []
+    order = []
+    todo = []
+    for i, node in enumerate(nodes):
+        missing = {n for n in reads(node) if n not in ready}
+        pending.append(len(missing))
+        for n in missing:
+            waiting.setdefault(n, []).append(i)
+        if not missing:
+            todo.append(i)
+    while todo:
+        i = todo.pop()
+        order.append(nodes[i])
+        for n in writes(nodes[i]):
+            for j in waiting.pop(n, ()):
+                pending[j] -= 1
+                if not pending[j]:
+                    todo.append(j)
+    if len(order) != len(nodes):
+        raise ValueError(f"{name}: combinational loop")
+    # breadth-first levels evaluate in the same order every time
+    level = {}
+    for node in order:
+        level[node] = max((level.get(('n', n), 0) for n in reads(node)), default=0) + 1
+        for n in writes(node):
+            level[('n', n)] = level[node]
+    return sorted(order, key=lambda node: level[node])
+
+
+def _optimize(net: Netlist) -> Netlist:
+    # constant propagation, structural hashing and dead-gate elimination.
+    # 'net.nodes' must be in evaluation order.
+    rep = list(range(net.n_nets)) # net -> the net with the same value
+    negation = {} # net -> the net it is the Not of
+    gates = {}    # (a, b) -> the net of Nand(a, b)
+    nodes = []
+
+    def nand(out, a, b):
+        # the net of Nand(a, b), adding a gate 'out' if there isn't one yet
+        if a > b:
+            a, b = b, a
+        if a == FALSE:
+            return TRUE
+        if a == TRUE or a == b:
+            # Not b
+            if b == TRUE:
+                return FALSE
+            if b in negation:
+                return negation[b]
+            key = (b, b)
+        elif negation.get(a) == b:
+            return TRUE # Nand(x, Not x)
+        else:
+            key = (a, b)
+        if key not in gates:
+            nodes.append(('nand', out) + key)
+            gates[key] = out
+            if a == b or a == TRUE:
+                negation[out] = b
+                negation.setdefault(b, out)
+        return gates[key]
+
+    for node in net.nodes:
+        if node[0] == 'nand':
+            _, out, a, b = node
+            rep[out] = nand(out, rep[a], rep[b])
+        else:
+            nodes.append(node)
+
+    def reps(nets):
+        return [rep[n] for n in nets]
+    outputs = [(pin, reps(nets)) for pin, nets in net.outputs]
+    signals = {s : reps(nets) for s, nets in net.signals.items()}
+    dffs = [(path, q, rep[d]) for path, q, d in net.dffs]
+    memories = [(chip, path, reps(address), reps(data_in), rep[load], out)
+                for chip, path, address, data_in, load, out in net.memories]
+
+    # keep only the nodes something observable depends on
+    live = {n for _, nets in outputs for n in nets} | {n for nets in signals.values() for n in nets}
+    live |= {d for _, _, d in dffs}
+    for _, _, address, data_in, load, _ in memories:
+        live.update(address + data_in + [load])
+    kept = []
+    for node in reversed(nodes):
+        if node[0] == 'nand':
+            if node[1] in live:
+                live.update(node[2:])
+                kept.append(node)
+        else:
+            _, _, address, _, _, out = memories[node[1]]
+            if live.intersection(out):
+                live.update(address)
+                kept.append(node)
+    kept.reverse()
+
+    # renumber: constants, sources, then node outputs in order
+    number = {FALSE : FALSE, TRUE : TRUE}
+    for n in [n for _, nets in net.inputs for n in nets] + [q for _, q, _ in dffs]:
+        number[n] = len(number)
+    for node in kept:
+        for n in ([node[1]] if node[0] == 'nand' else memories[node[1]][5]):
+            number[n] = len(number)
+    for memory in memories:
+        for n in memory[5]:
+            number.setdefault(n, len(number))
+    def ids(nets):
+        return [number[n] for n in nets]
+    for i, node in enumerate(kept):
+        if node[0] == 'nand':
+            kept[i] = ('nand', number[node[1]], number[node[2]], number[node[3]])
+    return Netlist(net.name,
+                   [(pin, ids(nets)) for pin, nets in net.inputs],
+                   [(pin, ids(nets)) for pin, nets in outputs],
+                   {s : ids(nets) for s, nets in signals.items()},
+                   kept,
+                   [(path, number[q], number[d]) for path, q, d in dffs],
+                   [(chip, path, ids(address), ids(data_in), number[load], ids(out))
+                    for chip, path, address, data_in, load, out in memories],
+                   len(number))
+
+def _read_cache(path: str):
+    # the marshalled value at 'path', or None
+    if path is None:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            return marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+
+def _write_cache(path: str, value):
+    if path is None:
+        return
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            marshal.dump(value, f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass # the cache is only an optimization
+
+def flatten(name: str, path: list = None, cache_dir: str = CACHE_DIR) -> Netlist:
+    """The optimized netlist of the chip 'name', found in 'path' (see
+    hdl_parser.find_hdl()). 'cache_dir' None disables the on-disk cache."""
+    return _Flattener(path, cache_dir).netlist(name)
@@ -0,0 +1,162 @@
+"""Parser for the nand2tetris HDL.
+
+Reads chip definitions like
+    CHIP Mux16 {
+        IN a[16], b[16], sel;
+        OUT out[16];
+        PARTS:
+        Mux (a=a[0], b=b[0], sel=sel, out=out[0]);
+        ...
+    }
+into ChipDef objects, and finds the .hdl file of a chip by name in the
+projects' chip directories (01, 02, 03/a, 03/b, 05).
+
+Example usage:
+    chip = load_chip('Mux8Way16')
+    chip.inputs    # [('a', 16), ..., ('sel', 3)]
+    chip.parts[0]  # ('Mux16', [Connection('a', None, None, 'a', None, None), ...])
+"""
+import os
+import re
+from collections import namedtuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+HDL_PATH = [os.path.join(ROOT, d) for d in ('01', '02', os.path.join('03', 'a'),
+                                            os.path.join('03', 'b'), '05')]
+
+# 'pin[pin_lo..pin_hi]=signal[sig_lo..sig_hi]'; a bound is None when the
+# whole pin or signal is meant
+Connection = namedtuple('Connection', 'pin pin_lo pin_hi signal sig_lo sig_hi')
+
+_TOKEN = re.compile(r'\s*(?:(//[^\n]*|/\*.*?\*/)|([A-Za-z_]\w*|\d+|\.\.|\S))', re.S)
+
+
+class ChipDef:
+    """A parsed CHIP: its pins and its parts, or the name it is BUILTIN as."""
+
+    def __init__(self, name: str, inputs: list, outputs: list, parts: list, builtin: str = None):
+        self.name = name
+        self.inputs = inputs    # [(pin, width)]
+        self.outputs = outputs  # [(pin, width)]
+        self.parts = parts      # [(chip name, [Connection])]
+        self.builtin = builtin
+
+    def pins(self) -> dict:
+        """pin -> width, inputs and outputs."""
+        return dict(self.inputs + self.outputs)
+
+
+def tokenize(text: str) -> list:
+    """Split HDL source into tokens, dropping comments."""
+    tokens = []
+    for match in _TOKEN.finditer(text):
+        if match.group(2):
+            tokens.append(match.group(2))
+    return tokens
+
+def parse(text: str) -> ChipDef:
+    """Parse the source of one chip. Raises ValueError on a syntax error."""
+    tokens = tokenize(text)
+    pos = 0
+
+    def peek():
+        return tokens[pos] if pos < len(tokens) else None
+
+    def take(expected: str = None) -> str:
+        nonlocal pos
+        token = peek()
+        if token is None or (expected is not None and token != expected):
+            raise ValueError(f"expected '{expected or 'token'}', got '{token}'")
+        pos += 1
+        return token
+
+    def number() -> int:
+        token = take()
+        if not token.isdigit():
+            raise ValueError(f"expected a number, got '{token}'")
+        return int(token)
+
+    def pin_list() -> list:
+        pins = []
+        while True:
+            name = take()
+            width = 1
+            if peek() == '[':
+                take('[')
+                width = number()
+                take(']')
+            pins.append((name, width))
+            if peek() != ',':
+                break
+            take(',')
+        take(';')
+        return pins
+
+    def sub_bus() -> tuple:
+        if peek() != '[':
+            return None, None
+        take('[')
+        lo = hi = number()
+        if peek() == '..':
+            take('..')
+            hi = number()
+        take(']')
+        return lo, hi
+
+    take('CHIP')
+    name = take()
+    take('{')
+    inputs, outputs, parts, builtin = [], [], [], None
+    if peek() == 'IN':
+        take('IN')
+        inputs = pin_list()
+    if peek() == 'OUT':
+        take('OUT')
+        outputs = pin_list()
+    if peek() == 'BUILTIN':
+        take('BUILTIN')
+        builtin = take()
+        take(';')
+        if peek() == 'CLOCKED':
+            take('CLOCKED')
+            pin_list()
+    else:
+        take('PARTS')
+        take(':')
+        while peek() != '}':
+            part = take()
+            take('(')
+            connections = []
+            while True:
+                pin = take()
+                pin_lo, pin_hi = sub_bus()
+                take('=')
+                signal = take()
+                sig_lo, sig_hi = sub_bus()
+                connections.append(Connection(pin, pin_lo, pin_hi, signal, sig_lo, sig_hi))
+                if peek() != ',':
+                    break
+                take(',')
+            take(')')
+            take(';')
+            parts.append((part, connections))
+    take('}')
+    return ChipDef(name, inputs, outputs, parts, builtin)
+
+def find_hdl(name: str, path: list = None) -> str:
+    """The path of '<name>.hdl' in the first directory of 'path' (default
+    HDL_PATH) that has it. Raises FileNotFoundError."""
+    for directory in (path or HDL_PATH):
+        filepath = os.path.join(directory, name + '.hdl')
+        if os.path.exists(filepath):
+            return filepath
+    raise FileNotFoundError(f"no {name}.hdl in {path or HDL_PATH}")
+
+def load_chip(name: str, path: list = None) -> ChipDef:
+    """Find and parse the chip 'name'."""
+    filepath = find_hdl(name, path)
+    with open(filepath, 'r', encoding=None) as f:
+        try:
+            return parse(f.read())
+        except ValueError as e:
+            raise ValueError(f"{filepath}: {e}") from None
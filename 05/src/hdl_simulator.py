@@ -0,0 +1,306 @@
+#!/usr/bin/python3
+"""Bit-parallel gate-level simulator for the nand2tetris HDL chips.
+
+A chip is flattened, through all of its parts, down to Nand gates, DFFs and
+the memory chips the Java simulator also treats as built in (RAM16K, Screen,
+Keyboard, ROM32K), see hdl_netlist.py. The gates are sorted by level, so
+that each comes after the gates it reads, and compiled into one
+straight-line Python function.
+
+Every net holds a 'lane': an int whose bit i is the net's value in test
+vector i, so a lane of width W evaluates W input vectors at once with one
+'&' and one '^' per Nand. Lanes are usually Python ints of any width, but
+the compiled function works just as well on NumPy uint64 arrays (64 vectors
+per element) with mask np.uint64(2**64 - 1).
+
+Combinational chips can be checked exhaustively against a Python model:
+each output bit is checked on every assignment of the input bits it depends
+on, e.g. 2^11 vectors per bit of Mux8Way16, 2^4 for all of DMux8Way.
+
+Example usage:
+    net = flatten('Mux8Way16')
+    check(net, REFERENCE['Mux8Way16']) # [] if every output bit is right
+
+    sim = Simulator(flatten('Register'), width=64) # 64 registers at once
+    sim.set('in', list(range(64)))
+    sim.set('load', 1)
+    sim.tick()
+    sim.get('out') # [0, 1, ..., 63]
+"""
+import random
+import sys
+from array import array
+from hdl_netlist import Netlist, flatten, CACHE_DIR
+from emulator import alu
+
+# most input bits an output bit may depend on to be checked exhaustively
+MAX_CONE = 14
+
+
+def pack(values: list, bits: int) -> list:
+    """Transpose per-vector values into 'bits' lanes."""
+    if not values:
+        return [0] * bits
+    columns = zip(*(format(value, f'0{bits}b')[-bits:] for value in reversed(values)))
+    lanes = [int(''.join(column), 2) for column in columns]
+    lanes.reverse()
+    return lanes
+
+def unpack(lanes: list, width: int) -> list:
+    """Transpose lanes back into 'width' per-vector values."""
+    if not lanes:
+        return [0] * width
+    rows = zip(*(format(lane, f'0{width}b') for lane in reversed(lanes)))
+    values = [int(''.join(row), 2) for row in rows]
+    values.reverse()
+    return values
+
+def _pattern(j: int, n: int) -> int:
+    # lane of input bit j when vector v is the assignment v, for n = 2^k vectors
+    half = 1 << j
+    return (((1 << half) - 1) << half) * (((1 << n) - 1) // ((1 << 2 * half) - 1))
+
+
+class MemoryChip:
+    """A built-in memory chip, with its own contents in every vector:
+    words[i] is the array('H') of vector i. All vectors share one ROM."""
+    def __init__(self, chip: str, width: int):
+        size = {'RAM16K' : 16384, 'Screen' : 8192, 'ROM32K' : 32768, 'Keyboard' : 1}[chip]
+        self.chip = chip
+        self.width = width
+        if chip == 'ROM32K':
+            self.words = [array('H', bytes(2 * size))] * width # shared
+        else:
+            self.words = [array('H', bytes(2 * size)) for _ in range(width)]
+
+    def __call__(self, *address) -> tuple:
+        addresses = unpack(address, self.width) if address else [0] * self.width
+        return tuple(pack([words[a] for words, a in zip(self.words, addresses)], 16))
+
+    def write(self, data_in: list, load: int, address: list):
+        if not load:
+            return
+        values = unpack(data_in, self.width)
+        addresses = unpack(address, self.width)
+        for i in range(self.width):
+            if load >> i & 1:
+                self.words[i][addresses[i]] = values[i]
+
+
+class Simulator:
+    """Runs 'width' copies of a netlist at once, one per test vector.
+
+    Pins are set and read as lists of per-vector values, or as lanes with
+    'set_lanes()' and 'get_lanes()'. 'eval()' settles the combinational
+    logic; 'tick()' also clocks the DFFs and memories, as a full clock cycle.
+    """
+
+    def __init__(self, netlist: Netlist, width: int = 64):
+        self.netlist = netlist
+        self.width = width
+        self.mask = (1 << width) - 1
+        self._evaluate = netlist.compile()
+        self._inputs = {pin : [0] * len(nets) for pin, nets in netlist.inputs}
+        self.state = [0] * len(netlist.dffs) # lane of each DFF
+        self.memories = [MemoryChip(m[0], width) for m in netlist.memories]
+        self._results = None
+
+    def memory(self, chip: str) -> MemoryChip:
+        """The first memory chip of kind 'chip' (e.g. 'RAM16K')."""
+        for memory in self.memories:
+            if memory.chip == chip:
+                return memory
+        raise KeyError(chip)
+
+    def load_rom(self, words):
+        """Load a program into the ROM32K."""
+        rom = self.memory('ROM32K').words[0]
+        rom[:len(words)] = array('H', words)
+        self._results = None
+
+    def set(self, pin: str, values):
+        """Set an input pin to one value per vector, or the same int in all."""
+        if isinstance(values, int):
+            values = [values] * self.width
+        self.set_lanes(pin, pack(values, len(self._inputs[pin])))
+
+    def set_lanes(self, pin: str, lanes: list):
+        self._inputs[pin] = list(lanes)
+        self._results = None
+
+    def get(self, pin: str) -> list:
+        """The value of an output pin in each vector."""
+        return unpack(self.get_lanes(pin), self.width)
+
+    def get_lanes(self, pin: str) -> list:
+        if self._results is None:
+            self.eval()
+        start = 0
+        for name, nets in self.netlist.outputs:
+            if name == pin:
+                return self._results[start:start + len(nets)]
+            start += len(nets)
+        raise KeyError(pin)
+
+    def eval(self):
+        sources = [lane for pin, _ in self.netlist.inputs for lane in self._inputs[pin]]
+        self._results = self._evaluate(self.mask, sources + self.state, self.memories)
+
+    def tick(self):
+        if self._results is None:
+            self.eval()
+        results = self._results
+        start = sum(len(nets) for _, nets in self.netlist.outputs)
+        self.state = list(results[start:start + len(self.state)])
+        start += len(self.state)
+        for memory in self.memories:
+            if memory.chip in ('RAM16K', 'Screen'):
+                bits = 14 if memory.chip == 'RAM16K' else 13
+                memory.write(results[start:start + 16], results[start + 16],
+                             results[start + 17:start + 17 + bits])
+                start += 17 + bits
+        self._results = None
+
+
+def check(netlist: Netlist, reference, max_cone: int = MAX_CONE, vectors: int = 4096) -> list:
+    """Compare a combinational netlist with 'reference', a function from
+    {input pin : value} to {output pin : value}. Output bits that depend on
+    at most 'max_cone' input bits are checked on every assignment of those
+    bits (with the other inputs 0), the rest on 'vectors' random inputs.
+    Returns the mismatches, as (inputs, output pin, bit, expected) tuples.
+    """
+    if netlist.dffs or netlist.memories:
+        raise ValueError(f"{netlist.name} is not combinational")
+    evaluate = netlist.compile()
+    sources = netlist.sources()
+    source_bit = {} # net -> (pin, bit)
+    for pin, nets in netlist.inputs:
+        for b, net in enumerate(nets):
+            source_bit[net] = (pin, b)
+    blank = {pin : 0 for pin, _ in netlist.inputs}
+
+    # group the output bits by the inputs they depend on
+    groups = {}
+    wide = []
+    for o, (pin, nets) in enumerate(netlist.outputs):
+        for b, net in enumerate(nets):
+            cone = tuple(sorted(netlist.cone(net)))
+            if len(cone) <= max_cone:
+                groups.setdefault(cone, []).append((o, pin, b))
+            else:
+                wide.append((o, pin, b))
+
+    failures = []
+    offsets = _output_offsets(netlist)
+    for cone, bits in groups.items():
+        n = 1 << len(cone)
+        position = {net : j for j, net in enumerate(cone)}
+        lanes = [_pattern(position[net], n) if net in position else 0 for net in sources]
+        results = evaluate((1 << n) - 1, lanes, [])
+        # each pin's value in vector v, doubling the table for each cone bit
+        columns = {pin : [0] for pin in blank}
+        for net in cone:
+            pin, bit = source_bit[net]
+            for name, column in columns.items():
+                column += [x + (1 << bit) for x in column] if name == pin else column
+        failures += _compare(reference, columns, bits, results, offsets, n)
+
+    if wide:
+        rng = random.Random(0)
+        lanes = [rng.getrandbits(vectors) for _ in sources]
+        results = evaluate((1 << vectors) - 1, lanes, [])
+        columns = {}
+        start = 0
+        for pin, nets in netlist.inputs:
+            columns[pin] = unpack(lanes[start:start + len(nets)], vectors)
+            start += len(nets)
+        failures += _compare(reference, columns, wide, results, offsets, vectors)
+    return failures
+
+def _compare(reference, columns: dict, outputs: list, results: list, offsets: list,
+             n: int) -> list:
+    # check 'outputs' [(output index, pin, bit)] in each of the 'n' vectors,
+    # where input pin p is columns[p][v] in vector v
+    got = {(o, b) : format(results[offsets[o] + b], f'0{n}b')[::-1] for o, _, b in outputs}
+    pins = list(columns)
+    failures = []
+    for v, values in enumerate(zip(*columns.values())):
+        inputs = dict(zip(pins, values))
+        expected = reference(inputs)
+        for o, pin, b in outputs:
+            want = expected[pin] >> b & 1
+            if got[(o, b)][v] != '01'[want]:
+                failures.append((inputs, pin, b, want))
+    return failures
+
+def _output_offsets(netlist: Netlist) -> list:
+    # index of each output pin's first bit in the results
+    offsets = []
+    start = 0
+    for _, nets in netlist.outputs:
+        offsets.append(start)
+        start += len(nets)
+    return offsets
+
+
+def _dmux(ways: int):
+    names = 'abcdefgh'[:ways]
+    return lambda p: {name : p['in'] if p['sel'] == i else 0 for i, name in enumerate(names)}
+
+def _alu(p: dict) -> dict:
+    out = alu(p['x'], p['y'], p['zx'], p['nx'], p['zy'], p['ny'], p['f'], p['no'])
+    return {'out' : out, 'zr' : int(out == 0), 'ng' : out >> 15}
+
+# Python models of the combinational chips of projects 01 and 02
+REFERENCE = {
+    'Nand' : lambda p: {'out' : 1 ^ (p['a'] & p['b'])},
+    'Not' : lambda p: {'out' : 1 ^ p['in']},
+    'And' : lambda p: {'out' : p['a'] & p['b']},
+    'Or' : lambda p: {'out' : p['a'] | p['b']},
+    'Xor' : lambda p: {'out' : p['a'] ^ p['b']},
+    'Mux' : lambda p: {'out' : p['b'] if p['sel'] else p['a']},
+    'DMux' : _dmux(2),
+    'Not16' : lambda p: {'out' : 0xFFFF ^ p['in']},
+    'And16' : lambda p: {'out' : p['a'] & p['b']},
+    'Or16' : lambda p: {'out' : p['a'] | p['b']},
+    'Mux16' : lambda p: {'out' : p['b'] if p['sel'] else p['a']},
+    'Or8Way' : lambda p: {'out' : int(p['in'] != 0)},
+    'Mux4Way16' : lambda p: {'out' : p['abcd'[p['sel']]]},
+    'Mux8Way16' : lambda p: {'out' : p['abcdefgh'[p['sel']]]},
+    'DMux4Way' : _dmux(4),
+    'DMux8Way' : _dmux(8),
+    'HalfAdder' : lambda p: {'sum' : p['a'] ^ p['b'], 'carry' : p['a'] & p['b']},
+    'FullAdder' : lambda p: {'sum' : p['a'] ^ p['b'] ^ p['c'],
+                             'carry' : (p['a'] + p['b'] + p['c']) >> 1},
+    'Add16' : lambda p: {'out' : (p['a'] + p['b']) & 0xFFFF},
+    'Inc16' : lambda p: {'out' : (p['in'] + 1) & 0xFFFF},
+    'ALU' : _alu,
+}
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    argparser = argparse.ArgumentParser(description='Gate-level HDL simulator')
+    argparser.add_argument('chips', nargs='+', help='chip names, e.g. Mux8Way16 CPU')
+    argparser.add_argument('--no-cache', action='store_true',
+                           help="don't read or write the on-disk netlist cache")
+    args = argparser.parse_args()
+
+    status = 0
+    for name in args.chips:
+        start = time.perf_counter()
+        net = flatten(name, cache_dir=None if args.no_cache else CACHE_DIR)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {net.gate_count()} Nand gates, {len(net.dffs)} DFFs, "
+              f"{len(net.memories)} memories, depth {net.depth()} ({elapsed * 1000:.1f} ms)")
+        if name in REFERENCE:
+            start = time.perf_counter()
+            failures = check(net, REFERENCE[name])
+            elapsed = time.perf_counter() - start
+            print(f"    check: {'ok' if not failures else f'{len(failures)} failures'} "
+                  f"({elapsed * 1000:.1f} ms)")
+            for inputs, pin, bit, want in failures[:5]:
+                print(f"    {inputs}: {pin}[{bit}] should be {want}")
+            status = status or bool(failures)
+    sys.exit(status)
@@ -0,0 +1,265 @@
+"""Idle-loop skipping for the Hack emulator.
+
+Interactive programs spend most of their cycles in loops that do nothing
+useful: Sys.wait counts down, Keyboard.readChar polls RAM[KBD] until a key
+changes. IdleSkippingEmulator finds such loops and jumps over them in bulk,
+giving exactly the state and cycle count that running them would.
+
+A loop is noticed when a backward jump reaches the same address twice in a
+row after the same number of cycles, its period P. From there, one
+iteration is run to measure the change it makes to the machine state
+(A, D and RAM), Delta, and a second iteration is run while tracking how
+that change flows through every instruction. The loop is skipped if, in
+that second iteration:
+- every RAM address and taken jump target is the same in all iterations
+  (A isn't changing when used as an address)
+- values that change only go through '+', '-', negation and '!', so they
+  change by the same amount every iteration; '&' and '|' only see values
+  that don't change
+- the state changes by Delta again
+Then iteration k starts from the state S + k * Delta and follows the same
+path, until an ALU output that decides a conditional jump changes sign, or
+reaches or leaves zero, which bounds the number of iterations skipped. A
+polling loop is the case Delta = 0: it repeats forever, so it's skipped up
+to the next scripted keyboard event or the end of the run.
+
+Example usage:
+    emu = IdleSkippingEmulator.from_file('Pong.hack')
+    emu.script_keys([(2_000_000, 132), (2_500_000, 0)]) # hold right arrow
+    emu.run(100_000_000)
+    emu.cycles, emu.skipped_cycles
+"""
+from array import array
+from emulator import Emulator, load_rom, SCREEN
+
+# 6 'c' bits -> (coefficient of D, coefficient of A or M) for the comps
+# that are affine in their inputs, mod 2^16. '!x' is '-x - 1'.
+_LINEAR = {
+    0b101010 : (0, 0),  # 0
+    0b111111 : (0, 0),  # 1
+    0b111010 : (0, 0),  # -1
+    0b001100 : (1, 0),  # D
+    0b110000 : (0, 1),  # A
+    0b001101 : (-1, 0), # !D
+    0b110001 : (0, -1), # !A
+    0b001111 : (-1, 0), # -D
+    0b110011 : (0, -1), # -A
+    0b011111 : (1, 0),  # D+1
+    0b110111 : (0, 1),  # A+1
+    0b001110 : (1, 0),  # D-1
+    0b110010 : (0, 1),  # A-1
+    0b000010 : (1, 1),  # D+A
+    0b010011 : (1, -1), # D-A
+    0b000111 : (-1, 1), # A-D
+}
+
+# longest loop period tried, in cycles
+MAX_PERIOD = 100_000
+# periods to wait before trying a loop that couldn't be skipped again
+RETRY_PERIODS = 256
+# bytes of RAM compared at a time when diffing snapshots
+_DIFF_CHUNK = 1024
+
+
+class IdleSkippingEmulator(Emulator):
+    """Emulator that skips idle loops and plays a scripted keyboard."""
+
+    def __init__(self, rom, keys=()):
+        """'rom' is an iterable of 16-bit instruction words. 'keys' is an
+        iterable of (cycle, key) events, as for 'script_keys()'."""
+        super().__init__(rom)
+        self._loops = {}  # loop head -> (cycle last reached, period)
+        self._retry = {}  # loop head -> cycle before which it isn't tried
+        self._period = 0
+        self._head = None # loop head _on_jump stopped at
+        self._watch = True # whether _on_jump looks for loops
+        self.skipped_cycles = 0
+        self.script_keys(keys)
+
+    @classmethod
+    def from_file(cls, path: str):
+        return cls(load_rom(path))
+
+    def script_keys(self, events):
+        """Schedule key presses: RAM[KBD] is set to 'key' once 'cycle'
+        cycles have run, for each (cycle, key) in 'events'. Key 0 releases."""
+        self._keys = sorted(events, reverse=True) # next event last
+
+    def run(self, max_cycles: int, stop_pc: int = None) -> int:
+        """Execute up to 'max_cycles' instructions, as Emulator.run(),
+        skipping idle loops, and return how many ran."""
+        keys = self._keys
+        n = 0
+        while n < max_cycles and not self.halted:
+            while keys and keys[-1][0] <= self.cycles:
+                self.set_key(keys.pop()[1])
+            limit = max_cycles - n
+            if keys:
+                limit = min(limit, keys[-1][0] - self.cycles)
+            self._head = None
+            ran = super().run(limit, stop_pc)
+            n += ran
+            head = self._head
+            if head is None:
+                if self.pc == stop_pc and ran < limit:
+                    break
+                continue
+            n += self._skip(head, limit - ran)
+        return n
+
+    def _on_jump(self, source: int, target: int, n: int) -> bool:
+        # stop at the head of a loop whose period has been the same twice,
+        # setting _head; see Emulator.run()
+        if target > source or not self._watch:
+            return False
+        loops = self._loops
+        now = self.cycles + n
+        seen = loops.get(target)
+        if (seen is not None and now - seen[0] == seen[1] <= MAX_PERIOD
+                and now >= self._retry.get(target, 0)):
+            self._head = target
+            self._period = seen[1]
+            return True
+        loops[target] = (now, now - seen[0] if seen else 0)
+        return False
+
+    def _skip(self, head: int, max_cycles: int) -> int:
+        # at the head of a loop: run two iterations to check that it can be
+        # skipped, then skip as many more as is safe. returns cycles run.
+        period = self._period
+        self._loops.clear()
+        if max_cycles < 2 * period:
+            return 0
+        start_cycles = self.cycles
+        before = self.ram.tobytes()
+        a, d = self.a, self.d
+        self._watch = False
+        Emulator.run(self, period)
+        self._watch = True
+        bound = None
+        if self.pc == head and not self.halted:
+            da = (self.a - a) & 0xFFFF
+            dd = (self.d - d) & 0xFFFF
+            ram_delta = _ram_delta(before, self.ram.tobytes())
+            bound = self._trace(period, da, dd, ram_delta)
+        if bound is None:
+            self._retry[head] = self.cycles + RETRY_PERIODS * period
+            return self.cycles - start_cycles
+
+        # every iteration from here adds the same delta, until 'bound' more
+        skip = min(bound, (max_cycles - 2 * period) // period)
+        self.a = (self.a + skip * da) & 0xFFFF
+        self.d = (self.d + skip * dd) & 0xFFFF
+        for addr, delta in ram_delta.items():
+            self.ram[addr] = (self.ram[addr] + skip * delta) & 0xFFFF
+            if addr >= SCREEN:
+                self.screen_dirty[(addr - SCREEN) >> 5] = 1
+        self.cycles += skip * period
+        self.skipped_cycles += skip * period
+        return self.cycles - start_cycles
+
+    def _trace(self, period: int, da: int, dd: int, ram_delta: dict):
+        # run one iteration of 'period' cycles from the loop head, tracking
+        # how the per-iteration deltas 'da', 'dd' and 'ram_delta' propagate.
+        # returns how many more iterations provably take the same path and
+        # add the same deltas, or None if that can't be shown.
+        rom = self._decoded
+        words = self.rom
+        ram = self.ram
+        dirty = self.screen_dirty
+        before = ram.tobytes()
+        a, d, pc = self.a, self.d, self.pc
+        start = (a, d, pc, da, dd)
+        deltas = dict(ram_delta)
+        bound = float('inf')
+        n = 0
+        ok = True
+        while ok and n < period:
+            if pc >= len(rom):
+                # ran off the end of the ROM
+                self.halted = True
+                ok = False
+                break
+            instr = rom[pc]
+            n += 1
+            if instr.__class__ is int:
+                a, da = instr, 0
+                pc += 1
+                continue
+            comp, read_m, write_a, write_d, write_m, jump = instr
+            addr = a & 0x7FFF
+            if da and (read_m or write_m or jump is not None):
+                ok = False # the address or jump target changes
+            if read_m:
+                y, dy = ram[addr], deltas.get(addr, 0)
+            else:
+                y, dy = a, da
+            out = comp(d, y)
+            coeffs = _LINEAR.get((words[pc] >> 6) & 0x3F)
+            if coeffs is not None:
+                dout = (coeffs[0] * dd + coeffs[1] * dy) & 0xFFFF
+            else:
+                dout = 0
+                if dd or dy:
+                    ok = False # '&' or '|' of a changing value
+            if write_m:
+                ram[addr] = out
+                if addr >= SCREEN:
+                    dirty[(addr - SCREEN) >> 5] = 1
+                if dout:
+                    deltas[addr] = dout
+                else:
+                    deltas.pop(addr, None)
+            if write_d:
+                d, dd = out, dout
+            if write_a:
+                a, da = out, dout
+            if dout and jump is not None and words[pc] & 0x7 != 0x7:
+                bound = min(bound, _same_class(out, dout))
+            if jump is not None and jump(out):
+                if addr == pc - 1 and rom[addr] == addr and not (write_a or write_d or write_m):
+                    pc = addr
+                    self.halted = True
+                    ok = False
+                    break
+                pc = addr
+            else:
+                pc += 1
+        self.a, self.d, self.pc = a, d, pc
+        self.cycles += n
+        if not ok or n != period or pc != start[2]:
+            return None
+        # the deltas must map to themselves, and the state must have
+        # changed by them again
+        a0, d0, _, da0, dd0 = start
+        if (da, dd) != (da0, dd0) or deltas != ram_delta:
+            return None
+        if ((a - a0) & 0xFFFF, (d - d0) & 0xFFFF) != (da0, dd0):
+            return None
+        if _ram_delta(before, ram.tobytes()) != ram_delta:
+            return None
+        return bound
+
+
+def _same_class(out: int, delta: int) -> int:
+    # how many more times 'delta' can be added to the ALU output 'out'
+    # before it changes sign or leaves zero, which could change a jump
+    s = out - 0x10000 if out & 0x8000 else out
+    ds = delta - 0x10000 if delta & 0x8000 else delta
+    if s == 0:
+        return 0
+    if s > 0:
+        return (32767 - s) // ds if ds > 0 else (s - 1) // -ds
+    return (s + 32768) // -ds if ds < 0 else (-s - 1) // ds
+
+def _ram_delta(before: bytes, after: bytes) -> dict:
+    # {address : (after - before) mod 2^16} for the words that differ
+    result = {}
+    for i in range(0, len(before), _DIFF_CHUNK):
+        if before[i:i + _DIFF_CHUNK] != after[i:i + _DIFF_CHUNK]:
+            old = array('H', before[i:i + _DIFF_CHUNK])
+            new = array('H', after[i:i + _DIFF_CHUNK])
+            for j, (x, y) in enumerate(zip(old, new)):
+                if x != y:
+                    result[i // 2 + j] = (y - x) & 0xFFFF
+    return result
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+"""Cycle-accurate profiler for Hack programs produced by the VM translator.
+
+Counts how many times each ROM address executes and rolls the counts up
+by the labels the VM translator emits (see 08/src/code_writer.py):
+- '(Class.func)' marks the entry of a VM function. Functions are laid out
+  contiguously, so every address belongs to the nearest function label
+  at or before it; code before the first one is the bootstrap (which
+  includes the shared call/return/compare routines of 'vm_translator.py
+  --shared').
+- 'Caller$ret.N' marks the return address of a call made by 'Caller'.
+A taken jump to a function entry from a call site is a call, and a taken
+jump to a return address is a return, which gives the dynamic call stack.
+Call sites are the jumps right before a return address, and the jumps of
+the shared '__call' routine. Other jumps to an entry, such as a loop back
+to a label at the start of a function without locals, aren't calls.
+
+Reports:
+- a flat profile (self and inclusive cycles, calls) per function
+- a pstats file, loadable with 'python3 -m pstats' or pstats.Stats, where
+  one 'second' is one cycle
+- folded stacks ('Sys.init;Main.main;Math.multiply 1234' per line), the
+  input format of flamegraph.pl, speedscope and similar tools
+
+Example usage:
+    prof = ProfilingEmulator.from_file('Pong.hack') # needs Pong.sym
+    prof.run(50_000_000)
+    prof.print_flat()
+    prof.write_pstats('pong.prof')
+    prof.write_folded('pong.folded')
+"""
+import bisect
+import itertools
+import marshal
+import os
+import sys
+from emulator import Emulator, load_rom, load_symbols
+
+BOOTSTRAP = '(bootstrap)'
+
+def is_function_label(label: str) -> bool:
+    """VM function labels are 'Class.func'; all other labels the translator
+    emits contain '$' or start with '_'."""
+    return '.' in label and '$' not in label and not label.startswith('_')
+
+def is_return_label(label: str) -> bool:
+    return '$ret.' in label
+
+
+class ProfilingEmulator(Emulator):
+    """Emulator that records per-address cycle counts and call stacks."""
+
+    def __init__(self, rom, symbols: dict, filename: str = 'rom'):
+        """'rom' is an iterable of 16-bit instruction words; 'symbols' maps
+        labels to ROM addresses, as read by 'emulator.load_symbols()'.
+        'filename' is reported as the file of every function in pstats."""
+        super().__init__(rom)
+        self.filename = filename
+        # executions of each address are counted per straight-line run,
+        # from a jump target to the next taken jump: +1 at its start and -1
+        # after its end, so that 'counts' is the running sum
+        self._run_counts = [0] * (len(self.rom) + 1)
+        self._run_start = 0
+
+        # function address ranges, for the static rollup
+        funcs = sorted((addr, label) for label, addr in symbols.items()
+                       if is_function_label(label))
+        self._func_starts = [addr for addr, _ in funcs]
+        self._func_names = [label for _, label in funcs]
+        self._entries = {addr : label for addr, label in funcs}
+        self._returns = {addr for label, addr in symbols.items() if is_return_label(label)}
+        self._call_sites = {addr - 1 for addr in self._returns}
+        if '__call' in symbols:
+            start = symbols['__call']
+            end = min((addr for addr in symbols.values() if addr > start), default=len(self.rom))
+            self._call_sites.update(range(start, end))
+
+        # dynamic call tracking
+        self._stack = [[BOOTSTRAP, 0, 0]] # [function, entry cycle, self cycles]
+        self._last_change = 0 # cycle of the last call or return
+        self.calls = {}      # function -> number of calls
+        self.recursive_calls = {} # function -> calls made while already active
+        self.inclusive = {}  # function -> cycles, counting recursion once
+        self.edges = {}      # (caller, callee) -> [calls, self cycles, inclusive cycles]
+        self.folded = {}     # call stack (tuple) -> self cycles
+
+    @classmethod
+    def from_file(cls, path: str):
+        sym_path = os.path.splitext(path)[0] + '.sym'
+        return cls(load_rom(path), load_symbols(sym_path), os.path.basename(path))
+
+    def function_at(self, addr: int) -> str:
+        """The function whose code contains ROM address 'addr'."""
+        i = bisect.bisect_right(self._func_starts, addr) - 1
+        return self._func_names[i] if i >= 0 else BOOTSTRAP
+
+    @property
+    def counts(self) -> list:
+        """How many times each ROM address has executed."""
+        return list(itertools.accumulate(self._run_counts[:-1]))
+
+    def run(self, max_cycles: int, stop_pc: int = None) -> int:
+        """Execute up to 'max_cycles' instructions, as Emulator.run(), while
+        profiling."""
+        self._run_start = self.pc
+        n = super().run(max_cycles, stop_pc)
+        # close the straight-line run in progress; a halt ends with the
+        # jump right after the halt loop's address
+        if self.halted and self.pc < len(self.rom):
+            end = self.pc + 2
+        else:
+            end = min(self.pc, len(self.rom))
+        if self._run_start < end:
+            self._run_counts[self._run_start] += 1
+            self._run_counts[end] -= 1
+        self._charge(self.cycles)
+        return n
+
+    def _on_jump(self, source: int, target: int, n: int) -> bool:
+        # addresses _run_start..source just ran once, straight through
+        counts = self._run_counts
+        counts[self._run_start] += 1
+        counts[source + 1] -= 1
+        self._run_start = target
+        if target in self._entries:
+            if source in self._call_sites:
+                self._call(self._entries[target], self.cycles + n)
+        elif target in self._returns:
+            self._return(self.cycles + n)
+        return False
+
+    def _charge(self, now: int):
+        # charge the cycles since the last stack change to the current frame
+        elapsed = now - self._last_change
+        self._last_change = now
+        self._stack[-1][2] += elapsed
+        key = tuple(frame[0] for frame in self._stack)
+        self.folded[key] = self.folded.get(key, 0) + elapsed
+
+    def _call(self, callee: str, now: int):
+        self._charge(now)
+        caller = self._stack[-1][0]
+        if any(frame[0] == callee for frame in self._stack):
+            self.recursive_calls[callee] = self.recursive_calls.get(callee, 0) + 1
+        self._stack.append([callee, now, 0])
+        self.calls[callee] = self.calls.get(callee, 0) + 1
+        self.edges.setdefault((caller, callee), [0, 0, 0])[0] += 1
+
+    def _return(self, now: int):
+        if len(self._stack) == 1:
+            return
+        self._charge(now)
+        callee, entered, self_cycles = self._stack.pop()
+        caller = self._stack[-1][0]
+        edge = self.edges[(caller, callee)]
+        edge[1] += self_cycles
+        if all(frame[0] != callee for frame in self._stack):
+            # outermost activation: count its time once
+            self.inclusive[callee] = self.inclusive.get(callee, 0) + now - entered
+            edge[2] += now - entered
+
+    def self_cycles(self) -> dict:
+        """Cycles spent in each function's own code, from the per-address counts."""
+        result = {}
+        counts = self.counts
+        starts = self._func_starts + [len(counts)]
+        result[BOOTSTRAP] = sum(counts[:starts[0]])
+        for i, name in enumerate(self._func_names):
+            result[name] = result.get(name, 0) + sum(counts[starts[i]:starts[i + 1]])
+        return result
+
+    def inclusive_cycles(self) -> dict:
+        """Cycles spent in each function and its callees, counting frames
+        still active when the run stopped up to the current cycle."""
+        result = dict(self.inclusive)
+        seen = set()
+        for name, entered, _ in self._stack:
+            if name not in seen:
+                seen.add(name)
+                result[name] = result.get(name, 0) + self.cycles - entered
+        return result
+
+    def flat(self) -> list:
+        """[(function, self cycles, inclusive cycles, calls)], most self cycles first."""
+        inclusive = self.inclusive_cycles()
+        rows = [(name, cycles, inclusive.get(name, 0), self.calls.get(name, 0))
+                for name, cycles in self.self_cycles().items() if cycles or name in inclusive]
+        return sorted(rows, key=lambda row: -row[1])
+
+    def print_flat(self, limit: int = 30, file=sys.stdout):
+        total = self.cycles or 1
+        print(f"{'self':>12} {'%':>6} {'inclusive':>12} {'calls':>9}  function", file=file)
+        for name, own, incl, calls in self.flat()[:limit]:
+            print(f"{own:>12} {100 * own / total:>6.2f} {incl:>12} {calls:>9}  {name}", file=file)
+
+    def write_pstats(self, path: str):
+        """Write the profile in the marshal format read by pstats.Stats."""
+        def key(name):
+            return (self.filename, self._func_start(name), name)
+        # live frames haven't been charged to their edges yet
+        open_self = {}
+        for i in range(1, len(self._stack)):
+            edge = (self._stack[i - 1][0], self._stack[i][0])
+            open_self[edge] = open_self.get(edge, 0) + self._stack[i][2]
+        inclusive = self.inclusive_cycles()
+        callers = {}
+        for (caller, callee), (n_calls, own, incl) in self.edges.items():
+            own += open_self.get((caller, callee), 0)
+            callers.setdefault(callee, {})[key(caller)] = (n_calls, n_calls, own, incl)
+        stats = {}
+        for name, own in self.self_cycles().items():
+            n_calls = self.calls.get(name, 0)
+            primitive = n_calls - self.recursive_calls.get(name, 0)
+            stats[key(name)] = (primitive, n_calls, float(own),
+                                float(inclusive.get(name, own)), callers.get(name, {}))
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def write_folded(self, path: str):
+        """Write folded stacks: one 'f1;f2;...;fn cycles' line per stack."""
+        with open(path, 'w', encoding=None) as f:
+            for stack, cycles in sorted(self.folded.items()):
+                if cycles:
+                    f.write(f"{';'.join(stack)} {cycles}\n")
+
+    def _func_start(self, name: str) -> int:
+        if name == BOOTSTRAP:
+            return 0
+        return self._func_starts[self._func_names.index(name)]
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description='Hack program profiler')
+    argparser.add_argument('rom', help='path to a .hack or .hackb file, with a .sym file next to it')
+    argparser.add_argument('max_cycles', nargs='?', type=int, default=10_000_000)
+    argparser.add_argument('--pstats', metavar='PATH', help='write a pstats profile')
+    argparser.add_argument('--folded', metavar='PATH', help='write folded stacks')
+    args = argparser.parse_args()
+
+    prof = ProfilingEmulator.from_file(args.rom)
+    prof.run(args.max_cycles)
+    prof.print_flat()
+    if args.pstats:
+        prof.write_pstats(args.pstats)
+    if args.folded:
+        prof.write_folded(args.folded)
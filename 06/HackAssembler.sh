@@ -1,3 +1,11 @@
 #!/bin/bash
 
-python3 src/assembler.py $1 
+# Usage: 'HackAssembler.sh source [source ...] [options]'
+# where each 'source' is a Xxx.asm file or a folder of .asm files; '@list.txt'
+# reads more sources from a file, one per line. All sources are assembled in a
+# single process, each to Xxx.hack (or Xxx.hackb with --binary, or a Xxx.hobj
+# module with --object) next to its source. See 'HackAssembler.sh -h' for options.
+#
+# Modules are linked with: 'python3 src/linker.py Prog.hack A.hobj B.hobj ...'
+
+python3 src/assembler.py "$@"
@@ -1,19 +1,57 @@
 #!/usr/bin/python3
-import sys
+import os
 import parser
 import decoder
 import symbol_table
+import hack_binary
+import peephole
+import hack_object
+from concurrent.futures import ProcessPoolExecutor
 
-def assemble(filepath: str):
+def assemble(
+        filepath: str,
+        binary: bool = False,
+        optimize: bool = False,
+        symbols: bool = False
+):
     """Assemble a given .asm file 'filepath' into its .hack binary
 
-    For a filepath 'my/file/path.asm', the binary will be 'my/file/path.hack'
+    For a filepath 'my/file/path.asm', the binary will be 'my/file/path.hack'.
+    If 'binary' is set, the output is written in the packed format of
+    'hack_binary.py' to 'my/file/path.hackb' instead. If 'optimize' is set,
+    the source is run through the peephole optimizer first. If 'symbols' is
+    set, the ROM address of every label is also written to 'my/file/path.sym'.
 
     Assembler source is assumed to be error-free. No error checking is provided.
     """
-    result = [] # lines of output
-    p = parser.Parser(sys.argv[1])
-    st = symbol_table.SymbolTable()
+    lines = _read_source(filepath, optimize)
+    result = _assemble_lines(lines)
+    _write_output(filepath, result, binary)
+    if symbols:
+        _write_symbols(filepath, lines)
+
+
+def assemble_source(source, st: symbol_table.SymbolTable = None) -> list:
+    """Assemble Hack assembly in memory and return the encoded 16-bit words.
+
+    'source' is either the program text or an iterable of its lines. If a
+    SymbolTable 'st' is given, it's used for assembly and is left holding
+    every label and variable of the program.
+
+    Example usage:
+        assemble_source('@2\nD=A\n') # [2, 60432]
+    """
+    if isinstance(source, str):
+        source = source.splitlines()
+    return _assemble_lines(list(parser.clean_lines(source)), st)
+
+def _assemble_lines(lines: list, st: symbol_table.SymbolTable = None) -> list:
+    # assemble_source() on lines already cleaned by parser.clean_lines()
+    if not lines:
+        return []
+    p = parser.Parser.from_clean_lines(lines)
+    st = st if st is not None else symbol_table.SymbolTable()
+    result = [] # encoded words
     next_var_addr = 16
 
     # first pass: populate symbol table with label declarations
@@ -34,33 +72,345 @@ def assemble(filepath: str):
     while True:
         instr_type = p.instruction_type()
         if instr_type == 'C_INSTRUCTION':
-            dest = decoder.dest(p.dest());
-            comp = decoder.comp(p.comp());
-            jump = decoder.jump(p.jump());
-            # format: '111accccccdddjjj'
-            result.append('111' + comp + dest + jump);
+            result.append(decoder.encode_c(p.instruction()))
         elif instr_type == 'A_INSTRUCTION':
             if p.symbol().isdigit():
-                dec = int(p.symbol())
-                result.append("{0:016b}".format(dec))
+                result.append(decoder.encode_a(int(p.symbol())))
             else:
                 if not st.contains(p.symbol()):
                     st.add_entry(p.symbol(), next_var_addr)
                     next_var_addr += 1
                 addr = st.get_address(p.symbol())
-                result.append("{0:016b}".format(addr))
+                result.append(decoder.encode_a(addr))
 
         if not p.has_more_lines():
             break
         p.advance()
 
-    # write output file
-    outpath = filepath[:-3] + 'hack'
-    with open(outpath, 'w', encoding=None) as f:
-        for line in result:
-            f.write(f"{line}\n")
+    return result
+
+
+def assemble_object(filepath: str, optimize: bool = False):
+    """Assemble a given .asm file 'filepath' into a relocatable object module.
+
+    For a filepath 'my/file/path.asm', the module will be 'my/file/path.hobj'.
+    Modules are combined into a program by 'linker.py'; see 'hack_object.py'.
+    """
+    module = _assemble_object_lines(_read_source(filepath, optimize))
+    module.save(filepath[:-3] + 'hobj')
+
+
+def assemble_source_object(source) -> hack_object.ObjectModule:
+    """Assemble Hack assembly in memory into an ObjectModule.
+
+    'source' is either the program text or an iterable of its lines.
+    References to builtin symbols are resolved, references to labels
+    declared in 'source' are relocated, and every other symbol is imported.
+    """
+    if isinstance(source, str):
+        source = source.splitlines()
+    return _assemble_object_lines(list(parser.clean_lines(source)))
+
+def _assemble_object_lines(lines: list) -> hack_object.ObjectModule:
+    # assemble_source_object() on lines already cleaned by parser.clean_lines()
+    module = hack_object.ObjectModule()
+    builtins = symbol_table.SymbolTable()
+
+    # first pass: exports
+    line_num = 0
+    for line in lines:
+        if line[0] == '(':
+            module.exports[line[1:-1]] = line_num
+        else:
+            line_num += 1
+
+    # second pass: translate
+    for line in lines:
+        if line[0] == '(':
+            continue
+        if line[0] != '@':
+            module.code.append(decoder.encode_c(line))
+            continue
+        symbol = line[1:]
+        if symbol.isdigit():
+            module.code.append(decoder.encode_a(int(symbol)))
+        elif symbol in module.exports:
+            module.relocs.append(len(module.code))
+            module.code.append(decoder.encode_a(module.exports[symbol]))
+        elif builtins.contains(symbol):
+            module.code.append(decoder.encode_a(builtins.get_address(symbol)))
+        else:
+            module.imports.setdefault(symbol, []).append(len(module.code))
+            module.code.append(0)
+    return module
+
+
+def assemble_batch(
+        filepaths,
+        binary: bool = False,
+        stream: bool = False,
+        jobs: int = 1,
+        optimize: bool = False,
+        obj: bool = False,
+        symbols: bool = False
+):
+    """Assemble many .asm files in this process, one after another.
+
+    Each file is written out as by 'assemble()', 'assemble_streaming()' if
+    'stream' is set, or 'assemble_parallel()' with 'jobs' workers if 'jobs'
+    is more than 1. If 'obj' is set, object modules are written instead, as
+    by 'assemble_object()', so 'binary', 'stream', 'jobs' and 'symbols'
+    don't apply. Paths to directories are expanded to the .asm
+    files they contain, in sorted order. 'optimize', 'symbols' and 'jobs'
+    can't be combined with 'stream'.
+    """
+    for filepath in _expand_sources(filepaths):
+        if obj:
+            assemble_object(filepath, optimize)
+        elif stream:
+            assemble_streaming(filepath, binary)
+        elif jobs > 1:
+            assemble_parallel(filepath, binary, jobs, optimize, symbols)
+        else:
+            assemble(filepath, binary, optimize, symbols)
+
+
+def _expand_sources(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.endswith('.asm'):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def assemble_streaming(filepath: str, binary: bool = False):
+    """Assemble a given .asm file 'filepath' into its .hack binary in one pass.
+
+    Produces the same output as 'assemble()', but the source is read lazily
+    and each instruction is written out as soon as it's read, so memory use is
+    proportional to the number of symbols rather than the number of lines.
+
+    A reference to a symbol that isn't defined yet is written as a placeholder.
+    Placeholders for the same symbol form a chain through the output file: each
+    one holds (index of the previous placeholder + 1), with 0 ending the chain,
+    so only the index of the latest placeholder is kept in memory. When the
+    label is declared, its chain is walked and patched in place. Symbols still
+    unresolved at the end are variables, which are allocated from address 16
+    in order of first use, just like 'assemble()'.
+
+    'binary' selects the output format, as for 'assemble()'.
+    """
+    p = parser.StreamParser(filepath)
+    st = symbol_table.SymbolTable()
+    pending = {} # symbol -> index of its latest placeholder
+    line_num = 0
+
+    outpath = filepath[:-3] + ('hackb' if binary else 'hack')
+    with open(outpath, 'wb+') as f:
+        if binary:
+            f.write(hack_binary.pack_header(0)) # word count is filled in at the end
+        while p.instruction() is not None: # None: no instructions at all
+            instr_type = p.instruction_type()
+            if instr_type == 'L_INSTRUCTION':
+                st.add_entry(p.symbol(), line_num)
+                if p.symbol() in pending:
+                    _patch_chain(f, pending.pop(p.symbol()), line_num, binary)
+            elif instr_type == 'C_INSTRUCTION':
+                f.write(_pack(decoder.encode_c(p.instruction()), binary))
+                line_num += 1
+            else:
+                if p.symbol().isdigit():
+                    word = decoder.encode_a(int(p.symbol()))
+                elif st.contains(p.symbol()):
+                    word = decoder.encode_a(st.get_address(p.symbol()))
+                else:
+                    # forward reference: link onto the symbol's chain
+                    word = pending.get(p.symbol(), -1) + 1
+                    pending[p.symbol()] = line_num
+                f.write(_pack(word, binary))
+                line_num += 1
+
+            if not p.has_more_lines():
+                break
+            p.advance()
+
+        # whatever is left unresolved is a variable
+        next_var_addr = 16
+        for symbol, head in pending.items():
+            st.add_entry(symbol, next_var_addr)
+            _patch_chain(f, head, next_var_addr, binary)
+            next_var_addr += 1
+
+        if binary:
+            f.seek(0)
+            f.write(hack_binary.pack_header(line_num))
+
+
+def assemble_parallel(
+        filepath: str,
+        binary: bool = False,
+        jobs: int = None,
+        optimize: bool = False,
+        symbols: bool = False
+):
+    """Assemble a given .asm file 'filepath' on a pool of 'jobs' processes.
+
+    Output is identical to 'assemble()'. 'jobs' defaults to the CPU count.
+
+    The cleaned instructions are split into chunks. Workers first scan each
+    chunk for its instruction count, label declarations, and symbol uses.
+    The chunk counts give each chunk's base address, so labels can be merged
+    into one SymbolTable; variables are then allocated from address 16 by
+    walking the symbol uses chunk by chunk, which is the same order a serial
+    pass sees them in. Finally, workers encode the chunks against the merged
+    table and the results are concatenated in order.
+    """
+    lines = _read_source(filepath, optimize)
+    jobs = jobs or os.cpu_count()
+    chunk_len = max(_MIN_CHUNK_LEN, -(-len(lines) // (jobs * 4)))
+    chunks = [lines[i:i + chunk_len] for i in range(0, len(lines), chunk_len)]
+
+    with ProcessPoolExecutor(jobs) as pool:
+        scans = list(pool.map(_scan_chunk, chunks))
+
+        # merge labels, then allocate variables in order of first use
+        st = symbol_table.SymbolTable()
+        base = 0
+        for n_instrs, labels, _ in scans:
+            for symbol, offset in labels:
+                st.add_entry(symbol, base + offset)
+            base += n_instrs
+        next_var_addr = 16
+        for _, _, uses in scans:
+            for symbol in uses:
+                if not st.contains(symbol):
+                    st.add_entry(symbol, next_var_addr)
+                    next_var_addr += 1
+
+        result = []
+        for words in pool.map(_encode_chunk, chunks, [st] * len(chunks)):
+            result.extend(words)
+
+    _write_output(filepath, result, binary)
+    if symbols:
+        _write_symbols(filepath, lines)
+
+
+# don't bother sending a worker fewer lines than this
+_MIN_CHUNK_LEN = 4096
+
+def _scan_chunk(lines: list) -> tuple:
+    # returns (instruction count, [(label, offset in chunk)], symbols used in
+    # A-instructions in order of first use)
+    n_instrs = 0
+    labels = []
+    uses = {}
+    for line in lines:
+        if line[0] == '(':
+            labels.append((line[1:-1], n_instrs))
+            continue
+        if line[0] == '@' and not line[1:].isdigit():
+            uses[line[1:]] = None
+        n_instrs += 1
+    return n_instrs, labels, list(uses)
+
+def _encode_chunk(lines: list, st: symbol_table.SymbolTable) -> list:
+    # encode a chunk of cleaned lines. every symbol must be in 'st'
+    words = []
+    for line in lines:
+        if line[0] == '@':
+            value = line[1:]
+            addr = int(value) if value.isdigit() else st.get_address(value)
+            words.append(decoder.encode_a(addr))
+        elif line[0] != '(':
+            words.append(decoder.encode_c(line))
+    return words
+
+def _read_source(filepath: str, optimize: bool) -> list:
+    # cleaned lines of 'filepath', optionally peephole-optimized
+    lines = list(parser.read_lines(filepath))
+    if optimize:
+        lines, saved = peephole.optimize(lines)
+        print(f"{filepath}: peephole optimizer saved {saved} instructions")
+    return lines
+
+def _write_output(filepath: str, words: list, binary: bool):
+    # write 'words' next to the source, as .hack text or .hackb
+    if binary:
+        hack_binary.write(filepath[:-3] + 'hackb', words)
+    else:
+        hack_binary.write_text(filepath[:-3] + 'hack', words)
+
+
+def _write_symbols(filepath: str, lines: list):
+    # write 'address label' for each label in 'lines', in ROM order
+    with open(filepath[:-3] + 'sym', 'w', encoding=None) as f:
+        line_num = 0
+        for line in lines:
+            if line[0] == '(':
+                f.write(f"{line_num} {line[1:-1]}\n")
+            else:
+                line_num += 1
+
+
+# a .hack text line; every line is exactly '_TEXT_LINE_LEN' bytes long
+_TEXT_WORD = "{0:016b}\n"
+_TEXT_LINE_LEN = 17
+
+def _pack(word: int, binary: bool) -> bytes:
+    return hack_binary.pack_word(word) if binary else _TEXT_WORD.format(word).encode()
+
+def _patch_chain(f, head: int, addr: int, binary: bool):
+    # overwrite every placeholder on the chain starting at word 'head' with 'addr'
+    idx = head
+    while idx != -1:
+        if binary:
+            pos = hack_binary.HEADER_LEN + idx * hack_binary.WORD_LEN
+            f.seek(pos)
+            link = hack_binary.unpack_word(f.read(hack_binary.WORD_LEN)) - 1
+        else:
+            pos = idx * _TEXT_LINE_LEN
+            f.seek(pos)
+            link = int(f.read(16), 2) - 1
+        f.seek(pos)
+        f.write(_pack(addr, binary))
+        idx = link
+    f.seek(0, 2)
 
 
 if __name__ == '__main__':
-    assemble(sys.argv[1])
+    import argparse
+    argparser = argparse.ArgumentParser(description='Hack assembler',
+                                        fromfile_prefix_chars='@')
+    argparser.add_argument('sources', nargs='+',
+                           help='.asm files or directories of .asm files. '
+                                "'@list.txt' reads more paths from a file, one per line")
+    argparser.add_argument('--stream', action='store_true',
+                           help='assemble in a single pass, without buffering the source')
+    argparser.add_argument('--binary', action='store_true',
+                           help='write a packed .hackb file instead of .hack text')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='assemble each file on a pool of JOBS processes')
+    argparser.add_argument('-O', '--optimize', action='store_true',
+                           help='run the peephole optimizer before encoding')
+    argparser.add_argument('-c', '--object', action='store_true',
+                           help='write a relocatable .hobj module, for linker.py')
+    argparser.add_argument('-s', '--symbols', action='store_true',
+                           help='also write the address of every label to a .sym file')
+    args = argparser.parse_args()
+    if args.stream and args.optimize:
+        argparser.error('--optimize needs the whole source and can\'t be used with --stream')
+    if args.stream and args.symbols:
+        argparser.error('--symbols can\'t be used with --stream')
+    if args.stream and args.jobs > 1:
+        argparser.error('--jobs can\'t be used with --stream, which reads the source in one pass')
+    if args.object:
+        for flag, used in (('--binary', args.binary), ('--stream', args.stream),
+                           ('--jobs', args.jobs > 1), ('--symbols', args.symbols)):
+            if used:
+                argparser.error(f'{flag} can\'t be used with --object, which writes a .hobj module')
 
+    assemble_batch(args.sources, args.binary, args.stream, args.jobs, args.optimize,
+                   args.object, args.symbols)
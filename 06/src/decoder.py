@@ -6,55 +6,89 @@ Example usage:
    decoder.dest('DM') # '011'
    decoder.comp('M+1') # '1110111'
    decoder.jump('JNE') # '101'
+
+   # integer encoding of a whole instruction, ready to be written out
+   decoder.encode_c('MD=M+1;JNE') # 0b1111110111011101
+   decoder.encode_a(21) # 0b0000000000010101
 """
+from itertools import permutations
+
+_DEST = {'' : '000',
+         'M' : '001',
+         'D' : '010',
+         'DM' : '011',
+         'A' : '100',
+         'AM' : '101',
+         'AD' : '110',
+         'ADM' : '111'
+}
+# allow any ordering of the destinations, e.g. 'DM' and 'MD'
+_DEST = {''.join(p) : code for s, code in _DEST.items() for p in permutations(s)}
+
+# 'a' bit is 0 here. the 'M' forms (a=1) are derived from the 'A' forms below.
+_COMP = {'0' : '101010',
+         '1' : '111111',
+         '-1' : '111010',
+         'D' : '001100',
+         'A' : '110000',
+         '!D' : '001101',
+         '!A' : '110001',
+         '-D' : '001111',
+         '-A' : '110011',
+         'D+1' : '011111',
+         'A+1' : '110111',
+         'D-1' : '001110',
+         'A-1' : '110010',
+         'D+A' : '000010',
+         'D-A' : '010011',
+         'A-D' : '000111',
+         'D&A' : '000000',
+         'D|A' : '010101',
+         # commutative spellings, as emitted by the VM translator
+         'A+D' : '000010',
+         'A&D' : '000000',
+         'A|D' : '010101'
+}
+_COMP = {**{s : '0' + code for s, code in _COMP.items()},
+         **{s.replace('A', 'M') : '1' + code for s, code in _COMP.items() if 'A' in s}}
+
+_JUMP = {'' : '000',
+         'JGT' : '001',
+         'JEQ' : '010',
+         'JGE' : '011',
+         'JLT' : '100',
+         'JNE' : '101',
+         'JLE' : '110',
+         'JMP' : '111'
+}
 
 def dest(s: str) -> str:
-    options = {'' : '000',
-               'M' : '001',
-               'D' : '010',
-               'DM' : '011',
-               'A' : '100',
-               'AM' : '101',
-               'AD' : '110',
-               'ADM' : '111'
-    }
-    s = ''.join(sorted(s)) # e.g. allows for 'DM' and 'MD'
-    return options[s] 
+    return _DEST[s]
 
 def comp(s: str) -> str:
-    a = '0' if s.find('M') == -1 else '1'
-    s = s.replace('M', 'A')
-
-    options = {'0' : '101010',
-               '1' : '111111',
-               '-1' : '111010',
-               'D' : '001100',
-               'A' : '110000',
-               '!D' : '001101',
-               '!A' : '110001',
-               '-D' : '001111',
-               '-A' : '110011',
-               'D+1' : '011111',
-               'A+1' : '110111',
-               'D-1' : '001110',
-               'A-1' : '110010',
-               'D+A' : '000010',
-               'D-A' : '010011',
-               'A-D' : '000111',
-               'D&A' : '000000',
-               'D|A' : '010101'
-    }
-    return a + options[s]
+    return _COMP[s]
 
 def jump(s: str) -> str:
-    options = {'' : '000',
-               'JGT' : '001',
-               'JEQ' : '010',
-               'JGE' : '011',
-               'JLT' : '100',
-               'JNE' : '101',
-               'JLE' : '110',
-               'JMP' : '111'
-    }
-    return options[s]
+    return _JUMP[s]
+
+def _build_c_table() -> dict:
+    # every spelling of 'dest=comp;jump' -> its 16-bit opcode
+    table = {}
+    for c, c_code in _COMP.items():
+        for d, d_code in _DEST.items():
+            for j, j_code in _JUMP.items():
+                spelling = (d + '=' if d else '') + c + (';' + j if j else '')
+                # format: '111accccccdddjjj'
+                table[spelling] = int('111' + c_code + d_code + j_code, 2)
+    return table
+
+C_TABLE = _build_c_table()
+
+def encode_c(instr: str) -> int:
+    """The 16-bit opcode of a whitespace-free C-instruction, e.g. 'AM=M+1;JMP'."""
+    return C_TABLE[instr]
 
+def encode_a(value: int) -> int:
+    """The 16-bit opcode of the A-instruction '@value'.
+    'value' should fit in 15 bits; it isn't checked."""
+    return value
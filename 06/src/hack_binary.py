@@ -0,0 +1,110 @@
+"""Compact binary form of Hack machine code ('.hackb' files).
+
+Layout (all little-endian):
+    bytes 0-3   magic b'HACK'
+    bytes 4-7   uint32 number of words
+    bytes 8-    the words, one uint16 each
+
+The 8-byte header keeps the words 2-byte aligned, so a ROM image can be
+mmap'd and viewed as an array of uint16 without copying or parsing anything.
+A .hackb file is 1/8 the size of the equivalent .hack text file.
+
+Example usage:
+    import hack_binary
+
+    hack_binary.write('Prog.hackb', [0b0000000000000010, 0b1110110000010000])
+    rom = hack_binary.map_rom('Prog.hackb') # zero-copy memoryview of uint16
+    rom[1] # 60432
+    hack_binary.binary_to_text('Prog.hackb', 'Prog.hack')
+"""
+import mmap
+import struct
+import sys
+from array import array
+
+MAGIC = b'HACK'
+HEADER = struct.Struct('<4sI')
+HEADER_LEN = HEADER.size # 8
+WORD_LEN = 2
+
+# array('H') and memoryview use the host's byte order, but the file is
+# little-endian. on big-endian hosts words must be swapped on load.
+_NATIVE_LE = sys.byteorder == 'little'
+
+def pack_header(n_words: int) -> bytes:
+    return HEADER.pack(MAGIC, n_words)
+
+def unpack_header(b: bytes) -> int:
+    """Returns the word count stored in a .hackb header."""
+    magic, n_words = HEADER.unpack_from(b)
+    if magic != MAGIC:
+        raise ValueError('not a .hackb file')
+    return n_words
+
+def pack_word(word: int) -> bytes:
+    return word.to_bytes(WORD_LEN, 'little')
+
+def unpack_word(b: bytes) -> int:
+    return int.from_bytes(b, 'little')
+
+def write(path: str, words):
+    """Write the 16-bit ints 'words' as a .hackb file."""
+    a = array('H', words)
+    if not _NATIVE_LE:
+        a.byteswap()
+    with open(path, 'wb') as f:
+        f.write(pack_header(len(a)))
+        a.tofile(f)
+
+def read(path: str) -> array:
+    """Read a .hackb file into an array('H') of words."""
+    with open(path, 'rb') as f:
+        n_words = unpack_header(f.read(HEADER_LEN))
+        a = array('H')
+        a.fromfile(f, n_words)
+    if not _NATIVE_LE:
+        a.byteswap()
+    return a
+
+def map_rom(path: str) -> memoryview:
+    """Memory-map a .hackb file and return its words as a read-only
+    memoryview of uint16, without copying.
+
+    The mapping stays open for as long as the view (or any slice of it) is
+    alive. Only available on little-endian hosts; use 'read()' elsewhere.
+    """
+    if not _NATIVE_LE:
+        raise RuntimeError('zero-copy views need a little-endian host')
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    n_words = unpack_header(mm)
+    return memoryview(mm)[HEADER_LEN:HEADER_LEN + n_words * WORD_LEN].cast('H')
+
+def read_text(path: str) -> array:
+    """Read a .hack text file into an array('H') of words."""
+    with open(path, 'r', encoding=None) as f:
+        return array('H', (int(line, 2) for line in f if line.strip()))
+
+def write_text(path: str, words):
+    """Write the 16-bit ints 'words' as a .hack text file."""
+    with open(path, 'w', encoding=None) as f:
+        for word in words:
+            f.write(f"{word:016b}\n")
+
+def text_to_binary(inpath: str, outpath: str):
+    """Convert a .hack text file to a .hackb file."""
+    write(outpath, read_text(inpath))
+
+def binary_to_text(inpath: str, outpath: str):
+    """Convert a .hackb file to a .hack text file."""
+    write_text(outpath, read(inpath))
+
+
+if __name__ == '__main__':
+    # usage: python3 hack_binary.py Prog.hack  -> Prog.hackb
+    #        python3 hack_binary.py Prog.hackb -> Prog.hack
+    path = sys.argv[1]
+    if path.endswith('.hackb'):
+        binary_to_text(path, path[:-1])
+    else:
+        text_to_binary(path, path + 'b')
@@ -0,0 +1,61 @@
+"""Relocatable object modules for separately assembled Hack code ('.hobj' files).
+
+A module is the assembled code of one .asm file, before it's been placed in
+ROM. Its words are final except for:
+- relocs: A-instructions that reference a label declared in this module.
+  They hold the label's offset within the module; the linker adds the
+  module's base address.
+- imports: A-instructions that reference a symbol this module doesn't
+  declare. They hold 0 until the linker resolves them, either to a label
+  exported by another module or, failing that, to a variable.
+Every label the module declares is exported, since Hack assembly has a
+single global namespace. Imports are kept in order of first use, so the
+linker can allocate variables in the same order as the assembler would.
+
+On disk a module is stored as JSON.
+
+Example usage:
+    import hack_object
+
+    m = hack_object.ObjectModule()
+    m.code = [0, 60039] # @LOOP / 0;JMP
+    m.exports = {'LOOP' : 0}
+    m.relocs = [0]
+    m.save('Loop.hobj')
+    hack_object.ObjectModule.load('Loop.hobj').exports # {'LOOP': 0}
+"""
+import json
+
+FORMAT = 'hobj'
+VERSION = 1
+
+class ObjectModule:
+    """The assembled, unlinked code of one module."""
+
+    def __init__(self):
+        self.code = []    # encoded words
+        self.exports = {} # label -> offset within the module
+        self.relocs = []  # indices of words holding a module-relative address
+        self.imports = {} # symbol -> indices of words that reference it
+
+    def save(self, path: str):
+        with open(path, 'w', encoding=None) as f:
+            json.dump({'format' : FORMAT,
+                       'version' : VERSION,
+                       'code' : self.code,
+                       'exports' : self.exports,
+                       'relocs' : self.relocs,
+                       'imports' : self.imports}, f)
+
+    @classmethod
+    def load(cls, path: str):
+        with open(path, 'r', encoding=None) as f:
+            d = json.load(f)
+        if d.get('format') != FORMAT or d.get('version') != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} .hobj file')
+        m = cls()
+        m.code = d['code']
+        m.exports = d['exports']
+        m.relocs = d['relocs']
+        m.imports = d['imports']
+        return m
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+import symbol_table
+import hack_object
+import hack_binary
+
+def link(modules, st: symbol_table.SymbolTable = None) -> list:
+    """Link ObjectModules into one program and return its encoded words.
+
+    Modules are placed in ROM one after another, in the given order. Labels
+    are resolved against every module's exports; any other imported symbol
+    is a variable, allocated from address 16 in order of first use. The
+    result is the same as assembling the modules' sources concatenated.
+
+    If a SymbolTable 'st' is given, it's used for linking and is left
+    holding every label and variable of the program. A label exported by
+    more than one module (or shadowing a builtin symbol) is an error.
+    """
+    st = st if st is not None else symbol_table.SymbolTable()
+
+    # place modules and merge their exports
+    bases = []
+    base = 0
+    for m in modules:
+        bases.append(base)
+        for label, offset in m.exports.items():
+            if st.contains(label):
+                raise ValueError(f'symbol {label} is declared more than once')
+            st.add_entry(label, base + offset)
+        base += len(m.code)
+
+    # relocate and resolve
+    result = []
+    next_var_addr = 16
+    for m, base in zip(modules, bases):
+        code = list(m.code)
+        for idx in m.relocs:
+            code[idx] += base
+        for symbol, indices in m.imports.items():
+            if not st.contains(symbol):
+                st.add_entry(symbol, next_var_addr)
+                next_var_addr += 1
+            addr = st.get_address(symbol)
+            for idx in indices:
+                code[idx] = addr
+        result.extend(code)
+    return result
+
+
+def link_files(inpaths, outpath: str):
+    """Link the .hobj files 'inpaths' into the program 'outpath'.
+
+    The output is a .hackb file if 'outpath' ends in '.hackb', and .hack
+    text otherwise.
+    """
+    words = link([hack_object.ObjectModule.load(path) for path in inpaths])
+    if outpath.endswith('.hackb'):
+        hack_binary.write(outpath, words)
+    else:
+        hack_binary.write_text(outpath, words)
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description='Hack linker')
+    argparser.add_argument('output', help='the linked program: a .hack file, or .hackb for binary')
+    argparser.add_argument('modules', nargs='+', metavar='module',
+                           help='.hobj modules written by assembler.py --object, in ROM order')
+    args = argparser.parse_args()
+    for path in args.modules:
+        if not path.endswith('.hobj'):
+            argparser.error(f'{path} is not a .hobj module')
+    if not args.output.endswith(('.hack', '.hackb')):
+        argparser.error(f'output {args.output} must end in .hack or .hackb')
+
+    link_files(args.modules, args.output)
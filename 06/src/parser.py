@@ -18,21 +18,22 @@ class Parser:
     """
 
     def __init__(self, filename: str):
-        with open(filename, 'r', encoding=None) as f:
-            self._lines = [line for line in f]
+        self._lines = list(read_lines(filename))
+        self.reset()
 
-        # trim whitespace and newlines.
-        self._lines = [line.replace(' ', '').replace('\n', '') for line in self._lines]
-        # remove comments, including in-line comments
-        tmp = []
-        for line in self._lines:
-            idx = line.find('//')
-            tmp.append(line[:idx if idx != -1 else None])
-        self._lines = tmp
-        # remove empty lines
-        self._lines = list(filter(lambda x: x != '', self._lines))
+    @classmethod
+    def from_lines(cls, lines):
+        """Create a parser over an iterable of assembly lines rather than a file."""
+        return cls.from_clean_lines(list(clean_lines(lines)))
 
-        self.reset()
+    @classmethod
+    def from_clean_lines(cls, lines: list):
+        """Create a parser over a non-empty list of lines already cleaned
+        by 'clean_lines()', without cleaning or copying them again."""
+        p = cls.__new__(cls)
+        p._lines = lines
+        p.reset()
+        return p
     
     def has_more_lines(self) -> bool:
         """True if the current line isn't the last line."""
@@ -41,9 +42,7 @@ class Parser:
     def advance(self):
         """Move ahead 1 line in the file."""
         self._curr_line += 1
-        self._current_line = self._lines[self._curr_line]
-        self._eq_idx = self._current_line.find('=')
-        self._colon_idx = self._current_line.find(';')
+        self._load(self._lines[self._curr_line])
 
     def reset(self):
         """Move to the first line in the file"""
@@ -62,6 +61,10 @@ class Parser:
         else:
             return 'C_INSTRUCTION'
 
+    def instruction(self) -> str:
+        """Returns the current instruction, with whitespace and comments removed."""
+        return self._current_line
+
     def symbol(self) -> str:
         """Returns xxx if the current line is '@xxx' or '(xxx)'."""
         if self._current_line[0] == '@':
@@ -83,3 +86,62 @@ class Parser:
         """Returns the symbolic 'jump' part of the current C-instruction."""
         return self._current_line[self._colon_idx+1:] if self._colon_idx != -1 else ''
 
+    def _load(self, line: str):
+        # make 'line' the current line
+        self._current_line = line
+        self._eq_idx = line.find('=')
+        self._colon_idx = line.find(';')
+
+
+class StreamParser(Parser):
+    """Parser that reads its file lazily, one line at a time.
+
+    Has the same interface as Parser, except that it can't be reset: lines
+    are pulled from the file as the parser advances and are never stored,
+    so memory use doesn't grow with the length of the file. A file with no
+    instructions has no current line: instruction() returns None.
+    """
+
+    def __init__(self, filename: str):
+        self._it = read_lines(filename)
+        self._next_line = next(self._it, None)
+        self._current_line = None
+        if self._next_line is not None:
+            self.advance()
+
+    def has_more_lines(self) -> bool:
+        """True if the current line isn't the last line."""
+        return self._next_line is not None
+
+    def advance(self):
+        """Move ahead 1 line in the file."""
+        self._load(self._next_line)
+        self._next_line = next(self._it, None)
+
+    def reset(self):
+        raise TypeError('StreamParser can only move forward')
+
+
+def read_lines(filename: str):
+    """Generator over the instructions of a Hack assembly file.
+
+    Yields each non-empty line with whitespace and comments removed.
+    """
+    with open(filename, 'r', encoding=None) as f:
+        yield from clean_lines(f)
+
+def clean_lines(lines):
+    """Generator over the instructions in an iterable of assembly lines.
+
+    Yields each non-empty line with whitespace and comments removed.
+    """
+    for line in lines:
+        # trim whitespace and newlines.
+        line = line.replace(' ', '').replace('\n', '')
+        # remove comments, including in-line comments
+        idx = line.find('//')
+        line = line[:idx if idx != -1 else None]
+        # skip empty lines
+        if line != '':
+            yield line
+
@@ -0,0 +1,120 @@
+"""Peephole optimizer for Hack assembly.
+
+Runs on cleaned assembly lines (see 'parser.clean_lines()'), before they're
+encoded, and removes or fuses redundant instructions without changing what
+the program does. Label declarations are barriers: no rewrite ever spans one,
+and instructions are never moved, so every jump target stays intact.
+
+Rewrites:
+- '@X' when A is already known to hold X is dropped.
+- '@X' directly followed by another A-instruction is dropped (dead load).
+- 'D=M' or 'M=D' when D already equals M is dropped, e.g. the reload in
+  '@R13 / M=D / @R13 / D=M'.
+- A pop into D followed by a push of D, or a push of D followed by a pop
+  into D, is fused into 3 instructions with no SP adjustment.
+- Code after an unconditional jump, up to the next label, is dropped.
+
+Example usage:
+    import peephole
+
+    lines, saved = peephole.optimize(['@R13', 'M=D', '@R13', 'D=M'])
+    # lines == ['@R13', 'M=D'], saved == 2
+"""
+
+# stack idioms, as emitted by the VM translator
+_POP_D = ['@SP', 'M=M-1', 'A=M', 'D=M']
+_PUSH_D = ['@SP', 'M=M+1', 'A=M-1', 'M=D']
+_FUSED = [
+    # pop then push: SP unchanged, D = A = top of stack
+    (_POP_D + _PUSH_D, ['@SP', 'A=M-1', 'D=M']),
+    # push then pop: SP unchanged, D kept, but the slot above the stack
+    # was still written, and A left pointing at it
+    (_PUSH_D + _POP_D, ['@SP', 'A=M', 'M=D']),
+]
+
+# addresses whose M can't be relied on to read back what was written
+_VOLATILE = ('KBD', '24576')
+
+def optimize(lines) -> tuple:
+    """Optimize an iterable of cleaned assembly lines.
+
+    Returns (optimized lines, number of instructions saved). Passes are
+    repeated until nothing changes, since one rewrite can expose another.
+    """
+    lines = list(lines)
+    before = _count_instructions(lines)
+    while True:
+        new_lines = _fuse_stack_ops(_forward_pass(lines))
+        if new_lines == lines:
+            break
+        lines = new_lines
+    return lines, before - _count_instructions(lines)
+
+def _count_instructions(lines: list) -> int:
+    return sum(1 for line in lines if line[0] != '(')
+
+def _forward_pass(lines: list) -> list:
+    # one pass tracking the known value of A and whether D == M
+    out = []
+    known_a = None      # symbol/constant A holds, if known
+    d_eq_m = False      # D == RAM[A]?
+    prev_is_a = False   # was the last kept instruction an A-instruction?
+    unreachable = False # after an unconditional jump?
+    for line in lines:
+        if line[0] == '(':
+            # jump target: nothing is known on entry
+            out.append(line)
+            known_a, d_eq_m, prev_is_a, unreachable = None, False, False, False
+            continue
+        if unreachable:
+            continue
+
+        if line[0] == '@':
+            value = line[1:]
+            if value == known_a:
+                continue
+            if prev_is_a:
+                out.pop()
+            out.append(line)
+            known_a, d_eq_m, prev_is_a = value, False, True
+            continue
+
+        eq_idx = line.find('=')
+        colon_idx = line.find(';')
+        dest = line[:eq_idx] if eq_idx != -1 else ''
+        comp = line[eq_idx + 1:colon_idx if colon_idx != -1 else None]
+        jump = line[colon_idx + 1:] if colon_idx != -1 else ''
+
+        if (not jump and d_eq_m and known_a is not None and known_a not in _VOLATILE
+                and (dest, comp) in (('D', 'M'), ('M', 'D'))):
+            continue
+
+        out.append(line)
+        prev_is_a = False
+        if 'A' in dest:
+            known_a, d_eq_m = None, False
+        elif 'D' in dest and 'M' in dest:
+            d_eq_m = True
+        elif (dest, comp) in (('D', 'M'), ('M', 'D')):
+            d_eq_m = True
+        elif dest:
+            d_eq_m = False
+        if jump == 'JMP':
+            unreachable = True
+    return out
+
+def _fuse_stack_ops(lines: list) -> list:
+    # replace the stack idioms in '_FUSED'. the patterns contain no labels,
+    # so a match never spans a jump target.
+    out = []
+    i = 0
+    while i < len(lines):
+        for pattern, replacement in _FUSED:
+            if lines[i:i + len(pattern)] == pattern:
+                out.extend(replacement)
+                i += len(pattern)
+                break
+        else:
+            out.append(lines[i])
+            i += 1
+    return out
@@ -0,0 +1,11 @@
+#!/bin/bash
+
+# Usage: 'VMInterpreter.sh source [max_steps] [--ram START[:END] ...]'
+# where 'source' is either a file name in the form Xxx.vm or the name of a folder
+# containing one or more .vm files, e.g. a compiled Jack program with the OS (12).
+# Runs the program directly at the VM level, starting with Sys.init, until Sys.halt
+# is called or 'max_steps' VM commands have run, then prints RAM[START:END] for each
+# --ram. RAM is laid out as by the VM translator, so results can be compared with
+# the Hack program's.
+
+python3 src/vm_interpreter.py "$@"
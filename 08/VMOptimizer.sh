@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# Usage: 'VMOptimizer.sh source [-o DIR] [-i [SIZE]]'
+# where 'source' is either a file name in the form Xxx.vm or the name of a folder
+# containing one or more .vm files, e.g. the Jack compiler's output. Rewrites each file
+# with equivalent, shorter VM code (constant folding, array store forwarding, not/if-goto
+# inversion, jump threading, unreachable code removal), in place or into DIR, and prints how many
+# commands each pass removed. With -i, calls to non-recursive functions of at most SIZE
+# commands (default 12) are first replaced by the functions' bodies, across the files of the
+# folder. Run it between the compiler and VMTranslator.sh.
+
+python3 src/vm_optimizer.py "$@"
@@ -1,11 +1,18 @@
 #!/bin/bash
 
-# Usage: 'VMTranslator.sh source' 
+# Usage: 'VMTranslator.sh source [-O | --optimize] [-s | --shared] [-j JOBS] [-t | --tree-shake]'
 # where 'source' is either a file name in the form Xxx.vm or the name of a folder
 # containing one or more .vm files. 'source' may contain a path. If no path is specified,
 # the translator operates on the current folder. Output is generated by translating all 
 # .vm files specified by 'source' and writing the result in a single 'source'.asm file
-# in the dir specified by 'source'.
+# in the dir specified by 'source'. With --optimize, compact assembly templates are used
+# instead of the simple ones; the result behaves the same, in far fewer instructions.
+# With --shared, call, return and eq/gt/lt also jump to one shared copy of their code,
+# for the smallest ROM at the cost of a few more cycles per call. With -j JOBS, the .vm files
+# of a folder are translated on JOBS processes; the output is the same either way, with the
+# files in sorted order. With --tree-shake, functions that can't be reached from Sys.init
+# (or from the OS functions the compiler calls implicitly) through the static call graph are
+# left out.
 
-python3 src/vm_translator.py $1
+python3 src/vm_translator.py "$@"
 
@@ -1,11 +1,15 @@
+import io
 import vm_constants as vm
 
 class CodeWriter:
     """Translates parsed VM commands into Hack assembly.
 
-    Output is written sequentially to the specified filepath.
+    Output is written sequentially to the specified filepath, or kept
+    in memory for 'getvalue()' if there is none.
     You must use 'set_vm_filename()' before any write commands
-    for ~each~ .vm file you work with.
+    for ~each~ .vm file you work with. Generated labels are unique
+    per file, so files can also be translated by separate CodeWriters
+    without bootstrap and joined with 'write_fragment()'.
 
     Example usage:
         cw = CodeWriter('out/Prog.asm')
@@ -20,26 +24,31 @@ class CodeWriter:
     # Developer note: this code was written for maximum simplicity, whereas optimization
     # was not a priority. Overall the generated assembly is far from optimal.
 
-    def __init__(self, filepath: str):
-        """Perform setup. 'filepath' is the .asm file to write output to."""
-        self._f = open(filepath, 'w', encoding=None)
+    def __init__(self, filepath: str = None, bootstrap: bool = True):
+        """Perform setup. 'filepath' is the .asm file to write output to.
+        Without 'bootstrap', the code that sets up the stack and calls
+        Sys.init is left out."""
+        self._f = open(filepath, 'w', encoding=None) if filepath else io.StringIO()
         # use user-inputted file base name for static var scoping
         self._filename_base = '_VM_init_filename'
         # bookeep current function name for labels and call/return
         self._curr_func = '_VM_init_func'
         # running integer for generating unique labels
         self._label_cnt = 0
-        
-        # Jack standard initialization: set SP=256 and call Sys.init
-        self._f.write('// standard bootstrap: setup stack and call Sys.init\n')
-        self._f.write('@256\nD=A\n@SP\nM=D\n')
-        self.write_call('Sys.init', 0)
+
+        if bootstrap:
+            # Jack standard initialization: set SP=256 and call Sys.init
+            self._f.write('// standard bootstrap: setup stack and call Sys.init\n')
+            self._f.write('@256\nD=A\n@SP\nM=D\n')
+            self.write_call('Sys.init', 0)
 
     def set_vm_filename(self, filepath: str):
         """Ready a new VM file for processing."""
         slash_idx = filepath.rfind('/')
         start = slash_idx + 1 if slash_idx != -1 else None
         self._filename_base = filepath[start:-3]
+        # labels are numbered per file, and scoped by function or file name
+        self._label_cnt = 0
 
     def write_arithmetic(self, command: str):
         """Translate an arithmetic command."""
@@ -186,6 +195,8 @@ class CodeWriter:
         """Translate a return command."""
         # store frame addr in R13
         self._f.write('@LCL\nD=M\n@R13\nM=D\n')
+        # store ret addr *(frame-5) in R14 before *ARG overwrites it (nArgs = 0)
+        self._f.write('@5\nA=D-A\nD=M\n@R14\nM=D\n')
         # *ARG = pop()
         self._pop_addr('R15')
         self._f.write('@R15\nD=M\n@ARG\nA=M\nM=D\n')
@@ -199,13 +210,21 @@ class CodeWriter:
         self._f.write('@R13\nD=M\n@3\nD=D-A\nA=D\nD=M\n@ARG\nM=D\n')
         # LCL = *(frame-4)
         self._f.write('@R13\nD=M\n@4\nD=D-A\nA=D\nD=M\n@LCL\nM=D\n')
-        # goto ret addr at *(frame-5)
-        self._f.write('@R13\nD=M\n@5\nD=D-A\nA=D\nA=M\n0;JMP\n')
+        # goto ret addr
+        self._f.write('@R14\nA=M\n0;JMP\n')
 
     def close(self):
         """Closes the output file."""
         self._f.close()
 
+    def getvalue(self) -> str:
+        """The output so far, if it's kept in memory."""
+        return self._f.getvalue()
+
+    def write_fragment(self, asm: str):
+        """Append the output of another CodeWriter, made without bootstrap."""
+        self._f.write(asm)
+
     def write_infinite_loop(self):
         """Write an infinite loop."""
         self._f.write('(__INF_LOOP)\n@__INF_LOOP\n0;JMP\n')
@@ -224,15 +243,259 @@ class CodeWriter:
         # RAM[addr] = RAM[sp--]
         self._f.write(f'@SP\nM=M-1\nA=M\nD=M\n@{addr}\nM=D\n')
 
+    def _cmp_label(self) -> str:
+        return f'_VM_CMP_{self._filename_base}.{self._label_cnt}'
+
     def _cmp(self, jump_instr: str):
         # compare the top 2 stack values. 'jump_instr' should be an explicit 
         # jump instruction using D, e.g. 'D;JEQ'
         self._pop_addr('R13')
         self._pop_addr('R14')
         self._f.write(
-            f'@R13\nD=M\n@R14\nM=M-D\nD=M\nM=-1\n@_VM_CMP_{self._label_cnt}\n' +
-            f'{jump_instr}\n@R14\nM=0\n(_VM_CMP_{self._label_cnt})\n'
+            f'@R13\nD=M\n@R14\nM=M-D\nD=M\nM=-1\n@{self._cmp_label()}\n' +
+            f'{jump_instr}\n@R14\nM=0\n({self._cmp_label()})\n'
         )
         self._push_addr('R14')
         self._label_cnt += 1
 
+
+
+class OptimizingCodeWriter(CodeWriter):
+    """CodeWriter that emits compact Hack assembly.
+
+    A drop-in replacement for CodeWriter: the same VM semantics, labels and
+    memory layout, but binary operators work in place on *(SP-1), pops use
+    'AM=M-1', constants are pushed straight from D, and small segment
+    indices are reached by incrementing A instead of through R13.
+
+    Hack instructions per VM command (labels not counted), i = index,
+    n = nArgs or nVars:
+
+        command                      CodeWriter   OptimizingCodeWriter
+        add, sub, and, or                    22     5
+        neg, not                             14     3
+        eq, gt, lt                           28    11
+        push constant i                      10     6 (4 for 0 and 1)
+        push local/argument/this/that i       9     7 (i <= 1), 8 (i = 2), 9
+        push static/temp/pointer i            6     6
+        pop local/argument/this/that i       13     6 (i <= 1), 5+i (i <= 7), 12
+        pop static/temp/pointer i             6     5
+        label                                 0     0
+        goto                                  2     2
+        if-goto                              10     5
+        function f n                       2+6n    4n (n <= 2), 5+2n
+        call f n                             46    40
+        return                               59    39
+
+    Example usage:
+        cw = OptimizingCodeWriter('out/Prog.asm')
+        cw.set_vm_filename('out/Prog.vm')
+        cw.write_push_pop(vm.CommandType.PUSH, 'constant', 1)
+        cw.close()
+    """
+    # largest index popped through A=A+1 steps rather than R13
+    DIRECT_POP_INDEX = 7
+
+    _BINARY = {'add' : 'M=D+M', 'sub' : 'M=M-D', 'and' : 'M=D&M', 'or' : 'M=D|M'}
+    _UNARY = {'neg' : 'M=-M', 'not' : 'M=!M'}
+    _JUMPS = {'eq' : 'D;JEQ', 'gt' : 'D;JGT', 'lt' : 'D;JLT'}
+    _POINTERS = {'local' : 'LCL', 'argument' : 'ARG', 'this' : 'THIS', 'that' : 'THAT'}
+
+    def write_arithmetic(self, command: str):
+        """Translate an arithmetic command."""
+        if command in self._BINARY:
+            # *(SP-2) = *(SP-2) op *(SP-1); SP--
+            self._f.write(f'@SP\nAM=M-1\nD=M\nA=A-1\n{self._BINARY[command]}\n')
+        elif command in self._UNARY:
+            self._f.write(f'@SP\nA=M-1\n{self._UNARY[command]}\n')
+        elif command in self._JUMPS:
+            # assume true, then overwrite with false if the jump isn't taken
+            label = self._cmp_label()
+            self._label_cnt += 1
+            self._f.write(
+                '@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\nM=-1\n' +
+                f'@{label}\n{self._JUMPS[command]}\n@SP\nA=M-1\nM=0\n({label})\n'
+            )
+        else:
+            print('ERROR - invalid arithmetic command')
+
+    def write_push_pop(
+            self,
+            cmd_type: vm.CommandType,
+            segment: str,
+            index: int
+    ):
+        """Translate a push/pop command at a given segment and index."""
+        if segment == 'constant':
+            if cmd_type != vm.CommandType.PUSH:
+                print('ERROR - UNIMPLEMENTED')
+            elif index in (0, 1):
+                self._f.write(f'@SP\nAM=M+1\nA=A-1\nM={index}\n')
+            else:
+                self._f.write(f'@{index}\nD=A\n')
+                self._push_d()
+        elif segment in self._POINTERS:
+            seg = self._POINTERS[segment]
+            if cmd_type == vm.CommandType.PUSH:
+                if index <= 2:
+                    self._f.write(f'@{seg}\n{self._deref(index)}\nD=M\n')
+                else:
+                    self._f.write(f'@{index}\nD=A\n@{seg}\nA=D+M\nD=M\n')
+                self._push_d()
+            elif index <= self.DIRECT_POP_INDEX:
+                self._f.write(f'@SP\nAM=M-1\nD=M\n@{seg}\n{self._deref(index)}\nM=D\n')
+            else:
+                self._f.write(
+                    f'@{seg}\nD=M\n@{index}\nD=D+A\n@R13\nM=D\n' +
+                    '@SP\nAM=M-1\nD=M\n@R13\nA=M\nM=D\n'
+                )
+        else:
+            addr = {
+                'static' : f'{self._filename_base}.{index}',
+                'temp' : str(5 + index),
+                'pointer' : 'THIS' if index == 0 else 'THAT',
+            }[segment]
+            if cmd_type == vm.CommandType.PUSH:
+                self._f.write(f'@{addr}\nD=M\n')
+                self._push_d()
+            else:
+                self._f.write(f'@SP\nAM=M-1\nD=M\n@{addr}\nM=D\n')
+
+    def write_if_goto(self, label: str):
+        """Translate an if-goto command with the given label name.
+        This instruction must be enclosed in the same function as
+        the label definiton."""
+        full_label = self._curr_func + f'${label}'
+        self._f.write(f'@SP\nAM=M-1\nD=M\n@{full_label}\nD;JNE\n')
+
+    def write_function(self, func_name: str, n_vars: int):
+        """Translate a fuction command. 'func_name' is the fully
+        qualified function name, e.g. 'Main.main'."""
+        self._curr_func = func_name
+        self._f.write(f'({func_name})\n')
+        if n_vars <= 2:
+            self._f.write('@SP\nAM=M+1\nA=A-1\nM=0\n' * n_vars)
+        else:
+            # zero the locals in place, then bump SP once
+            self._f.write('@SP\nA=M\n' + 'M=0\nA=A+1\n' * n_vars + 'D=A\n@SP\nM=D\n')
+
+    def write_call(self, func_name: str, n_args: int):
+        """Translate a call command. 'func_name' is the fully
+        qualified function name, e.g. 'Main.main'."""
+        ret_addr = self._curr_func + f'$ret.{self._label_cnt}'
+        self._label_cnt += 1
+        # push return address, LCL, ARG, THIS, THAT
+        self._f.write(f'@{ret_addr}\nD=A\n')
+        self._push_d()
+        for pointer in ('LCL', 'ARG', 'THIS', 'THAT'):
+            self._f.write(f'@{pointer}\nD=M\n')
+            self._push_d()
+        # LCL = SP; ARG = SP - 5 - nArgs
+        self._f.write(f'@SP\nD=M\n@LCL\nM=D\n@{5 + n_args}\nD=D-A\n@ARG\nM=D\n')
+        self._f.write(f'@{func_name}\n0;JMP\n({ret_addr})\n')
+
+    def write_return(self):
+        """Translate a return command."""
+        # ret addr *(LCL-5) to R14, before *ARG overwrites it (nArgs = 0)
+        self._f.write('@LCL\nD=M\n@5\nA=D-A\nD=M\n@R14\nM=D\n')
+        # *ARG = pop(); SP = ARG + 1
+        self._f.write('@SP\nAM=M-1\nD=M\n@ARG\nA=M\nM=D\nD=A+1\n@SP\nM=D\n')
+        # walk LCL down the frame: THAT, THIS, ARG, LCL = *(frame-1..4)
+        for pointer in ('THAT', 'THIS', 'ARG', 'LCL'):
+            self._f.write(f'@LCL\nAM=M-1\nD=M\n@{pointer}\nM=D\n')
+        self._f.write('@R14\nA=M\n0;JMP\n')
+
+    # private methods
+    def _push_d(self):
+        # RAM[SP++] = D
+        self._f.write('@SP\nAM=M+1\nA=A-1\nM=D\n')
+
+    @staticmethod
+    def _deref(index: int) -> str:
+        # with A = a segment pointer, set A = RAM[A] + index
+        if index == 0:
+            return 'A=M'
+        return 'A=M+1' + '\nA=A+1' * (index - 1)
+
+
+class SharedRoutineCodeWriter(OptimizingCodeWriter):
+    """OptimizingCodeWriter that shares call, return and compare code.
+
+    Right after the bootstrap, one copy of each of these routines is written:
+        __call       R13 = 5 + nArgs, R14 = callee, D = return address
+        __return     returns from the current function
+        __cmp_eq, __cmp_gt, __cmp_lt
+                     D = return address; replaces the top two stack
+                     values with the comparison's result
+    and call sites just load the registers and jump. Per VM command:
+
+        command       OptimizingCodeWriter   SharedRoutineCodeWriter
+        call f n                        40    12 (+40 shared)
+        return                          39     2 (+39 shared)
+        eq, gt, lt                      11     4 (+15 shared each)
+
+    This trades ROM for cycles: a call runs 12 more instructions, a return
+    2 more and a comparison 8 more than in OptimizingCodeWriter.
+
+    Example usage:
+        cw = SharedRoutineCodeWriter('out/Prog.asm')
+        cw.set_vm_filename('out/Prog.vm')
+        cw.write_call('Math.multiply', 2)
+        cw.close()
+    """
+
+    def __init__(self, filepath: str = None, bootstrap: bool = True):
+        """Perform setup, as CodeWriter. The shared routines follow the
+        bootstrap and a halt loop after its call to Sys.init."""
+        super().__init__(filepath, bootstrap)
+        if bootstrap:
+            # Sys.init doesn't return, but its return label must not share
+            # an address with __call, or profilers take calls for returns
+            self._f.write('(__BOOTSTRAP_END)\n@__BOOTSTRAP_END\n0;JMP\n')
+            self._f.write('// shared routines\n')
+            self._write_routines()
+
+    def write_arithmetic(self, command: str):
+        """Translate an arithmetic command."""
+        if command in self._JUMPS:
+            label = self._cmp_label()
+            self._label_cnt += 1
+            self._f.write(f'@{label}\nD=A\n@__cmp_{command}\n0;JMP\n({label})\n')
+        else:
+            super().write_arithmetic(command)
+
+    def write_call(self, func_name: str, n_args: int):
+        """Translate a call command. 'func_name' is the fully
+        qualified function name, e.g. 'Main.main'."""
+        ret_addr = self._curr_func + f'$ret.{self._label_cnt}'
+        self._label_cnt += 1
+        self._f.write(
+            f'@{5 + n_args}\nD=A\n@R13\nM=D\n@{func_name}\nD=A\n@R14\nM=D\n' +
+            f'@{ret_addr}\nD=A\n@__call\n0;JMP\n({ret_addr})\n'
+        )
+
+    def write_return(self):
+        """Translate a return command."""
+        self._f.write('@__return\n0;JMP\n')
+
+    # private methods
+    def _write_routines(self):
+        # __call: push D (return address), LCL, ARG, THIS, THAT;
+        # LCL = SP; ARG = SP - R13; goto R14
+        self._f.write('(__call)\n')
+        self._push_d()
+        for pointer in ('LCL', 'ARG', 'THIS', 'THAT'):
+            self._f.write(f'@{pointer}\nD=M\n')
+            self._push_d()
+        self._f.write('@SP\nD=M\n@LCL\nM=D\n@R13\nD=D-M\n@ARG\nM=D\n@R14\nA=M\n0;JMP\n')
+        # __return: the in-line return of OptimizingCodeWriter
+        self._f.write('(__return)\n')
+        super().write_return()
+        # __cmp_xx: the in-line comparison, then back to D (saved in R15)
+        for command, jump in self._JUMPS.items():
+            self._f.write(
+                f'(__cmp_{command})\n@R15\nM=D\n' +
+                '@SP\nAM=M-1\nD=M\nA=A-1\nD=M-D\nM=-1\n' +
+                f'@__cmp_{command}_end\n{jump}\n@SP\nA=M-1\nM=0\n' +
+                f'(__cmp_{command}_end)\n@R15\nA=M\n0;JMP\n'
+            )
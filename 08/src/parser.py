@@ -1,69 +1,90 @@
 import vm_constants as vm
 
+class Command:
+    """One parsed VM command.
+
+    'op' is its int opcode (vm.ADD, ..., vm.RETURN, or vm.UNKNOWN), 'arg1'
+    the first argument as a str (the operation itself for arithmetic, None
+    for return) and 'arg2' the second as an int (None if it has none).
+    'text' is the source line, without comments.
+    """
+    __slots__ = ('op', 'arg1', 'arg2', 'text')
+
+    def __init__(self, op: int, arg1: str, arg2: int, text: str):
+        self.op = op
+        self.arg1 = arg1
+        self.arg2 = arg2
+        self.text = text
+
+    def __repr__(self):
+        return f'Command({self.text!r})'
+
+
+def parse_lines(lines) -> list:
+    """Parse an iterable of VM source lines into a list of Commands, in one
+    pass. Whitespace, comments, and empty lines are ignored."""
+    opcodes = vm.OPCODES
+    commands = []
+    for line in lines:
+        idx = line.find('//')
+        if idx != -1:
+            line = line[:idx]
+        tokens = line.split()
+        if not tokens:
+            continue
+        op = opcodes.get(tokens[0], vm.UNKNOWN)
+        if op <= vm.NOT:
+            arg1 = tokens[0]
+        else:
+            arg1 = tokens[1] if len(tokens) > 1 else None
+        arg2 = int(tokens[2]) if len(tokens) > 2 else None
+        commands.append(Command(op, arg1, arg2, ' '.join(tokens)))
+    return commands
+
+
 class Parser:
     """Parser for the Jack VM standard implementation.
 
-    Instantiate a Parser on a filepath for some .vm file to begin parsing
-    one line at a time. Whitespace, comments, and empty lines are ignored.
+    Instantiate a Parser on a filepath for some .vm file to parse all of
+    it into typed Command records, then either iterate 'commands()' or step
+    through it one line at a time. Whitespace, comments, and empty lines
+    are ignored.
 
     Example usage:
+        p = Parser('my/Prog.vm')
+        for cmd in p.commands():
+            if cmd.op == vm.PUSH:
+                print(cmd.arg1, cmd.arg2)
+
         p = Parser('my/Prog.vm')
         while(p.has_more_lines()):
-            print(p.arg_1())
             p.advance()
+            print(p.arg_1())
     """
 
     def __init__(self, filepath: str):
-        """Open a VM program for parsing. Starts at logical line index -1."""
+        """Open and parse a VM program. Starts at logical line index -1."""
         with open(filepath, 'r', encoding=None) as f:
-            self._lines = [line.replace('\n', '') for line in f]
-
-        # remove comments and trailing whitespace
-        tmp = []
-        for line in self._lines:
-            idx = line.find('//')
-            tmp.append(line[:idx if idx != -1 else None].rstrip())
-        self._lines = tmp
-
-        # remove empty lines
-        self._lines = list(filter(lambda x: x != '', self._lines))
-
+            self._commands = parse_lines(f)
         self._idx = -1
-        self._tokens = []
+        self._cmd = None
+
+    def commands(self):
+        """Generate the program's Commands in order."""
+        yield from self._commands
 
     def has_more_lines(self) -> bool:
         """Returns True if there are more lines after the current line."""
-        return self._idx + 1 < len(self._lines)
+        return self._idx + 1 < len(self._commands)
 
     def advance(self):
         """Advance to the next line."""
         self._idx += 1
-        # break line into tokens
-        self._tokens = self._lines[self._idx].split(' ')
+        self._cmd = self._commands[self._idx]
 
     def command_type(self) -> vm.CommandType:
         """Return the CommandType of the current line."""
-        arith_cmds = ('add', 'sub', 'neg', 'eq', 'gt', 'lt', 'and', 'or', 'not')
-        if self._tokens[0] in arith_cmds:
-            return vm.CommandType.ARITHMETIC
-        elif self._tokens[0] == 'push':
-            return vm.CommandType.PUSH
-        elif self._tokens[0] == 'pop':
-            return vm.CommandType.POP
-        elif self._tokens[0] == 'label':
-            return vm.CommandType.LABEL
-        elif self._tokens[0] == 'goto':
-            return vm.CommandType.GOTO
-        elif self._tokens[0] == 'if-goto':
-            return vm.CommandType.IF_GOTO
-        elif self._tokens[0] == 'function':
-            return vm.CommandType.FUNCTION
-        elif self._tokens[0] == 'call':
-            return vm.CommandType.CALL
-        elif self._tokens[0] == 'return':
-            return vm.CommandType.RETURN
-        else:
-            return vm.CommandType.UNKNOWN
+        return vm.COMMAND_TYPES[self._cmd.op]
 
     def arg_1(self) -> str:
         """Return the first argument of the command on the current line.
@@ -71,17 +92,13 @@ class Parser:
         itself, e.g. 'add'.
         Should not be called for the 'RETURN' command type.
         """
-        if self.command_type() == vm.CommandType.ARITHMETIC:
-            return self._tokens[0]
-        else:
-            return self._tokens[1]
+        return self._cmd.arg1
 
     def arg_2(self) -> int:
         """Return the second argument of the command on the current line.
         Should only be called for command types with 2 arguments: push, pop, function, and call."""
-        return self._tokens[2]
+        return self._cmd.arg2
 
     # debug
     def get_current_line(self):
-        return ' '.join(self._tokens)
-
+        return self._cmd.text
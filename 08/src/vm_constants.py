@@ -13,3 +13,21 @@ class CommandType(Enum):
     CALL = 9
     UNKNOWN = 10
 
+
+# int opcodes of the preparsed command stream, one per VM command
+# (see parser.Command)
+(ADD, SUB, NEG, EQ, GT, LT, AND, OR, NOT,
+ PUSH, POP, LABEL, GOTO, IF_GOTO, FUNCTION, CALL, RETURN, UNKNOWN) = range(18)
+
+OPCODES = {
+    'add' : ADD, 'sub' : SUB, 'neg' : NEG, 'eq' : EQ, 'gt' : GT, 'lt' : LT,
+    'and' : AND, 'or' : OR, 'not' : NOT,
+    'push' : PUSH, 'pop' : POP, 'label' : LABEL, 'goto' : GOTO, 'if-goto' : IF_GOTO,
+    'function' : FUNCTION, 'call' : CALL, 'return' : RETURN,
+}
+
+# opcode -> CommandType
+COMMAND_TYPES = ((CommandType.ARITHMETIC,) * 9 +
+                 (CommandType.PUSH, CommandType.POP, CommandType.LABEL, CommandType.GOTO,
+                  CommandType.IF_GOTO, CommandType.FUNCTION, CommandType.CALL,
+                  CommandType.RETURN, CommandType.UNKNOWN))
@@ -0,0 +1,335 @@
+import os
+import vm_constants as vm
+import parser
+
+# RAM layout of the standard VM mapping on the Hack platform
+RAM_SIZE = 32768
+STACK_BASE = 256
+STATIC_BASE = 16
+TEMP_BASE = 5
+SCREEN = 16384
+KBD = 24576
+
+# interpreter opcodes; push/pop are specialized by segment, and 'RAM'
+# stands for the directly addressed static and temp segments
+(_PUSH_CONSTANT, _PUSH_LOCAL, _PUSH_ARGUMENT, _PUSH_THIS, _PUSH_THAT, _PUSH_RAM,
+ _PUSH_POINTER, _POP_LOCAL, _POP_ARGUMENT, _POP_THIS, _POP_THAT, _POP_RAM,
+ _POP_POINTER, _ADD, _SUB, _NEG, _EQ, _GT, _LT, _AND, _OR, _NOT, _GOTO, _IF_GOTO,
+ _CALL, _FUNCTION, _RETURN, _HALT) = range(28)
+
+_PUSHES = {'constant' : _PUSH_CONSTANT, 'local' : _PUSH_LOCAL, 'argument' : _PUSH_ARGUMENT,
+           'this' : _PUSH_THIS, 'that' : _PUSH_THAT, 'static' : _PUSH_RAM,
+           'temp' : _PUSH_RAM, 'pointer' : _PUSH_POINTER}
+_POPS = {'local' : _POP_LOCAL, 'argument' : _POP_ARGUMENT, 'this' : _POP_THIS,
+         'that' : _POP_THAT, 'static' : _POP_RAM, 'temp' : _POP_RAM, 'pointer' : _POP_POINTER}
+_ARITHMETIC = {vm.ADD : _ADD, vm.SUB : _SUB, vm.NEG : _NEG, vm.EQ : _EQ, vm.GT : _GT,
+               vm.LT : _LT, vm.AND : _AND, vm.OR : _OR, vm.NOT : _NOT}
+
+
+class VMInterpreter:
+    """Runs Jack VM programs directly, without translating them to Hack.
+
+    The parsed commands of all .vm files (see parser.Parser) are compiled
+    into one flat list of (opcode, a, b) int tuples, one per command:
+    labels are dropped, and jumps and calls refer to list indices. These
+    run on a RAM of Python ints laid out as the VM translator lays out
+    Hack RAM, so programs see the same memory as on the Hack computer:
+    SP, LCL, ARG, THIS and THAT in RAM[0..4], temp at 5..12, statics from
+    16 (numbered in order of first use, as the assembler does), the stack
+    from 256, the screen at 16384 and the keyboard at 24576. All values
+    wrap around at 16 bits, and gt/lt compare as signed 16-bit ints.
+
+    Like the translator's bootstrap, the interpreter starts by calling
+    Sys.init. A call to Sys.halt, or Sys.init returning, halts it.
+
+    Example usage:
+        vmi = VMInterpreter.from_path('my/Project') # .vm files, e.g. with the OS
+        vmi.run(10_000_000)
+        vmi.ram[8000], vmi.steps, vmi.halted
+
+        vmi = VMInterpreter.from_path('my/Math.vm')
+        vmi.call('Math.multiply', 6, 7) # 42
+    """
+
+    def __init__(self, files: list):
+        """'files' is a list of (.vm file name, [parser.Command]), in the
+        order the translator would put them."""
+        self.ram = [0] * RAM_SIZE
+        self.steps = 0
+        self.halted = False
+        self.functions = {} # function name -> index of its code
+        self._code = [(_HALT, 0, 0)] # return address 0 halts
+        self._compile(files)
+        self.pc = 0
+        self.ram[0] = STACK_BASE
+        if 'Sys.init' in self.functions:
+            self._push_frame(0, 0)
+            self.pc = self.functions['Sys.init']
+
+    @classmethod
+    def from_path(cls, source: str):
+        """Load a .vm file, or all .vm files of a directory in sorted order."""
+        if os.path.isfile(source):
+            paths = [source]
+        else:
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                           if name.endswith('.vm'))
+        return cls([(path, list(parser.Parser(path).commands())) for path in paths])
+
+    def run(self, max_steps: int) -> int:
+        """Execute up to 'max_steps' VM commands, or until halted, and
+        return how many ran."""
+        code = self._code
+        ram = self.ram
+        # SP, LCL, ARG, THIS and THAT live in locals during the run; segment
+        # accesses to RAM[0..4] store them first, and writes reload them
+        sp, lcl, arg, this, that = ram[0:5]
+        pc = self.pc
+        n = 0
+        while n < max_steps:
+            op, a, b = code[pc]
+            pc += 1
+            n += 1
+            # most frequent first
+            if op == _PUSH_ARGUMENT:
+                addr = arg + a
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                ram[sp] = ram[addr]
+                sp += 1
+            elif op == _PUSH_LOCAL:
+                addr = lcl + a
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                ram[sp] = ram[addr]
+                sp += 1
+            elif op == _PUSH_CONSTANT:
+                ram[sp] = a
+                sp += 1
+            elif op == _NOT:
+                ram[sp - 1] ^= 0xFFFF
+            elif op == _ADD:
+                sp -= 1
+                ram[sp - 1] = (ram[sp - 1] + ram[sp]) & 0xFFFF
+            elif op == _IF_GOTO:
+                sp -= 1
+                if ram[sp]:
+                    pc = a
+            elif op == _PUSH_RAM:
+                ram[sp] = ram[a]
+                sp += 1
+            elif op == _LT:
+                sp -= 1
+                ram[sp - 1] = 0xFFFF if (ram[sp - 1] ^ 0x8000) < (ram[sp] ^ 0x8000) else 0
+            elif op == _POP_LOCAL:
+                sp -= 1
+                addr = lcl + a
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                    ram[addr] = ram[sp]
+                    sp, lcl, arg, this, that = ram[0:5]
+                else:
+                    ram[addr] = ram[sp]
+            elif op == _AND:
+                sp -= 1
+                ram[sp - 1] &= ram[sp]
+            elif op == _EQ:
+                sp -= 1
+                ram[sp - 1] = 0xFFFF if ram[sp - 1] == ram[sp] else 0
+            elif op == _CALL:
+                # push the return index and the caller's frame
+                ram[sp:sp + 5] = (pc, lcl, arg, this, that)
+                sp += 5
+                arg = sp - 5 - b
+                lcl = sp
+                pc = a
+            elif op == _FUNCTION:
+                ram[sp:sp + a] = [0] * a
+                sp += a
+            elif op == _RETURN:
+                # read the frame first: with no args, *ARG is the return index
+                ret, saved_lcl, saved_arg, this, that = ram[lcl - 5:lcl]
+                ram[arg] = ram[sp - 1]
+                sp = arg + 1
+                pc, lcl, arg = ret, saved_lcl, saved_arg
+            elif op == _GOTO:
+                pc = a
+            elif op == _POP_POINTER:
+                sp -= 1
+                if a:
+                    that = ram[sp]
+                else:
+                    this = ram[sp]
+            elif op == _PUSH_THAT:
+                addr = (that + a) & 0x7FFF
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                ram[sp] = ram[addr]
+                sp += 1
+            elif op == _POP_RAM:
+                sp -= 1
+                ram[a] = ram[sp]
+            elif op == _GT:
+                sp -= 1
+                ram[sp - 1] = 0xFFFF if (ram[sp - 1] ^ 0x8000) > (ram[sp] ^ 0x8000) else 0
+            elif op == _OR:
+                sp -= 1
+                ram[sp - 1] |= ram[sp]
+            elif op == _SUB:
+                sp -= 1
+                ram[sp - 1] = (ram[sp - 1] - ram[sp]) & 0xFFFF
+            elif op == _POP_THAT:
+                sp -= 1
+                addr = (that + a) & 0x7FFF
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                    ram[addr] = ram[sp]
+                    sp, lcl, arg, this, that = ram[0:5]
+                else:
+                    ram[addr] = ram[sp]
+            elif op == _POP_ARGUMENT:
+                sp -= 1
+                addr = arg + a
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                    ram[addr] = ram[sp]
+                    sp, lcl, arg, this, that = ram[0:5]
+                else:
+                    ram[addr] = ram[sp]
+            elif op == _NEG:
+                ram[sp - 1] = -ram[sp - 1] & 0xFFFF
+            elif op == _PUSH_THIS:
+                addr = (this + a) & 0x7FFF
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                ram[sp] = ram[addr]
+                sp += 1
+            elif op == _POP_THIS:
+                sp -= 1
+                addr = (this + a) & 0x7FFF
+                if addr < 5:
+                    ram[0:5] = sp, lcl, arg, this, that
+                    ram[addr] = ram[sp]
+                    sp, lcl, arg, this, that = ram[0:5]
+                else:
+                    ram[addr] = ram[sp]
+            elif op == _PUSH_POINTER:
+                ram[sp] = that if a else this
+                sp += 1
+            else: # _HALT
+                pc -= 1
+                self.halted = True
+                break
+        ram[0:5] = sp, lcl, arg, this, that
+        self.pc = pc
+        self.steps += n
+        return n
+
+    def call(self, name: str, *args, max_steps: int = 100_000_000) -> int:
+        """Call the function 'name' with 'args' on the current RAM, run it to
+        its return, and return its result. Raises RuntimeError if it halts
+        the program or doesn't return within 'max_steps'."""
+        ram = self.ram
+        sp = ram[0]
+        for i, value in enumerate(args):
+            ram[sp + i] = value & 0xFFFF
+        ram[0] = sp + len(args)
+        self._push_frame(0, len(args))
+        pc = self.pc
+        self.pc = self.functions[name]
+        self.halted = False
+        self.run(max_steps)
+        if not self.halted or self.pc != 0 or ram[0] != sp + 1:
+            raise RuntimeError(f"{name} didn't return")
+        self.halted = False
+        self.pc = pc
+        ram[0] = sp
+        return ram[sp]
+
+    def _push_frame(self, ret: int, n_args: int):
+        # what 'call' does, returning to code index 'ret'
+        ram = self.ram
+        sp = ram[0]
+        ram[sp:sp + 5] = (ret, ram[1], ram[2], ram[3], ram[4])
+        ram[2] = sp - n_args
+        ram[0] = ram[1] = sp + 5
+
+    def _compile(self, files: list):
+        # two passes: find every function's and label's index, then emit
+        code = self._code
+        labels = {} # (function, label) -> index
+        start = len(code)
+        for _, commands in files:
+            func = None
+            for cmd in commands:
+                if cmd.op == vm.FUNCTION:
+                    func = cmd.arg1
+                    self.functions[func] = start
+                elif cmd.op == vm.LABEL:
+                    labels[(func, cmd.arg1)] = start
+                    continue
+                start += 1
+
+        statics = {} # (file, index) -> address
+        for path, commands in files:
+            filename = os.path.basename(path)[:-3]
+            func = None
+            for cmd in commands:
+                op = cmd.op
+                if op <= vm.NOT:
+                    code.append((_ARITHMETIC[op], 0, 0))
+                elif op in (vm.PUSH, vm.POP):
+                    segment, index = cmd.arg1, cmd.arg2
+                    table = _PUSHES if op == vm.PUSH else _POPS
+                    if segment not in table:
+                        raise ValueError(f"{path}: bad command '{cmd.text}'")
+                    if segment == 'static':
+                        key = (filename, index)
+                        if key not in statics:
+                            statics[key] = STATIC_BASE + len(statics)
+                        index = statics[key]
+                    elif segment == 'temp':
+                        index += TEMP_BASE
+                    code.append((table[segment], index, 0))
+                elif op == vm.LABEL:
+                    pass
+                elif op in (vm.GOTO, vm.IF_GOTO):
+                    if (func, cmd.arg1) not in labels:
+                        raise ValueError(f"{path}: no label '{cmd.arg1}' in {func}")
+                    code.append((_GOTO if op == vm.GOTO else _IF_GOTO, labels[(func, cmd.arg1)], 0))
+                elif op == vm.FUNCTION:
+                    func = cmd.arg1
+                    code.append((_FUNCTION, cmd.arg2, 0))
+                elif op == vm.CALL:
+                    if cmd.arg1 == 'Sys.halt':
+                        code.append((_HALT, 0, 0))
+                    elif cmd.arg1 not in self.functions:
+                        raise ValueError(f"{path}: call to undefined function {cmd.arg1}")
+                    else:
+                        code.append((_CALL, self.functions[cmd.arg1], cmd.arg2))
+                elif op == vm.RETURN:
+                    code.append((_RETURN, 0, 0))
+                else:
+                    raise ValueError(f"{path}: bad command '{cmd.text}'")
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+    argparser = argparse.ArgumentParser(description='Jack VM interpreter')
+    argparser.add_argument('source', help='a .vm file or a folder of .vm files')
+    argparser.add_argument('max_steps', nargs='?', type=int, default=100_000_000)
+    argparser.add_argument('--ram', metavar='START[:END]', action='append', default=[],
+                           help='print RAM[START:END] after the run')
+    args = argparser.parse_args()
+
+    vmi = VMInterpreter.from_path(args.source)
+    start = time.perf_counter()
+    vmi.run(args.max_steps)
+    elapsed = time.perf_counter() - start
+    print(f"{vmi.steps} VM commands in {elapsed:.2f} s" + (', halted' if vmi.halted else ''))
+    for spec in args.ram:
+        lo, _, hi = spec.partition(':')
+        lo = int(lo)
+        hi = int(hi) if hi else lo + 1
+        print(f"RAM[{lo}:{hi}] = {vmi.ram[lo:hi]}")
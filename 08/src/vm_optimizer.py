@@ -0,0 +1,602 @@
+import os
+import vm_constants as vm
+import parser
+
+# binary and unary arithmetic on 16-bit values, as in vm_interpreter.py
+def _signed(x: int) -> int:
+    return x - 0x10000 if x & 0x8000 else x
+
+_BINARY = {
+    vm.ADD : lambda x, y: (x + y) & 0xFFFF,
+    vm.SUB : lambda x, y: (x - y) & 0xFFFF,
+    vm.AND : lambda x, y: x & y,
+    vm.OR : lambda x, y: x | y,
+    vm.EQ : lambda x, y: 0xFFFF if x == y else 0,
+    vm.GT : lambda x, y: 0xFFFF if _signed(x) > _signed(y) else 0,
+    vm.LT : lambda x, y: 0xFFFF if _signed(x) < _signed(y) else 0,
+}
+_UNARY = {
+    vm.NEG : lambda x: -x & 0xFFFF,
+    vm.NOT : lambda x: x ^ 0xFFFF,
+}
+
+# functions the Jack compiler calls for constructors, '*', '/' and string
+# constants; kept along with Sys.init when tree shaking
+IMPLICIT_CALLS = ('Memory.alloc', 'Math.multiply', 'Math.divide', 'String.new',
+                  'String.appendChar')
+
+# default Inliner.max_size, in commands: enough for Math.abs/min/max,
+# Memory.peek/poke and the short String getters
+INLINE_MAX_SIZE = 12
+
+# passes, in the order they run, as reported in the stats
+PASSES = ('constant folding', 'array stores', 'not/if-goto inversion',
+          'jump threading', 'unreachable code')
+
+
+def command(text: str) -> parser.Command:
+    """The Command for one line of VM code."""
+    return parser.parse_lines([text])[0]
+
+def write_vm(commands: list, filepath: str):
+    """Write Commands to a .vm file, one per line."""
+    with open(filepath, 'w', encoding=None) as f:
+        for cmd in commands:
+            f.write(cmd.text + '\n')
+
+
+class VMOptimizer:
+    """Optimizes Jack VM code, e.g. the Jack compiler's output.
+
+    Works on the parsed Commands of a .vm file (see parser.Parser) and
+    returns equivalent, shorter code. Each function is rewritten on its
+    own, with these passes run until none changes anything:
+    - constant folding: arithmetic on constants is computed, e.g.
+      'push constant 1; neg' stays but 'push constant 2; push constant 3;
+      add' becomes 'push constant 5', and a constant condition turns an
+      if-goto into a goto or removes it. 'not; not' and 'neg; neg' go.
+    - array stores: the compiler's 'let a[i] = X', 'push X; pop temp 0;
+      pop pointer 1; push temp 0; pop that 0', becomes 'pop pointer 1;
+      push X; pop that 0' when X is a constant or a segment other than
+      'that' and 'pointer 1'. The store to temp 0 is dead, so this is only
+      done in functions that read temp 0 nowhere else, as the compiler's
+      output never does; like the compiler, it assumes no function reads
+      temp 0 before setting it.
+    - not/if-goto inversion: 'not; if-goto L; A; label L', where A ends in
+      a goto or return (the compiler's if, if/else and while) and the
+      condition is a comparison, or and/or/not of comparisons, becomes
+      'if-goto L.not; label L', and 'label L.not; A' moves to the end of the
+      function. This saves the 'not' on every branch.
+    - jump threading: a jump to a label that is followed by 'goto M'
+      jumps to M instead, and a goto to the label right after it goes.
+    - unreachable code: commands after a goto or return, up to the next
+      label that is jumped to, are removed, as are labels never jumped to.
+    'stats' counts the commands each pass removed, not counting labels,
+    which generate no code.
+
+    'gt' and 'lt' are folded as signed comparisons, per the VM spec.
+    Statics may be first used in a different order after optimizing, so
+    the assembler can give them different addresses.
+
+    Example usage:
+        opt = VMOptimizer()
+        commands = opt.optimize(list(parser.Parser('Main.vm').commands()))
+        write_vm(commands, 'Main.vm')
+        opt.stats # {'constant folding' : 12, ...}
+    """
+
+    def __init__(self):
+        self.stats = {name : 0 for name in PASSES}
+        self.commands_in = 0
+        self.commands_out = 0
+
+    def optimize(self, commands: list) -> list:
+        """Optimize one .vm file's Commands."""
+        result = []
+        for func in _split_functions(commands):
+            result += self._optimize_function(func)
+        self.commands_in += _code_size(commands)
+        self.commands_out += _code_size(result)
+        return result
+
+    def _optimize_function(self, commands: list) -> list:
+        passes = ((PASSES[0], _fold_constants), (PASSES[1], _forward_array_stores),
+                  (PASSES[2], _invert_conditions), (PASSES[3], _thread_jumps),
+                  (PASSES[4], _remove_unreachable))
+        changed = True
+        while changed:
+            changed = False
+            for name, rewrite in passes:
+                result = rewrite(commands)
+                if result != commands:
+                    self.stats[name] += _code_size(commands) - _code_size(result)
+                    changed = True
+                    commands = result
+        return commands
+
+
+class Inliner:
+    """Inlines calls to small functions across a program's .vm files.
+
+    A call to a function of at most 'max_size' commands is replaced by the
+    function's body, saving the call and return frames. The function must
+    be non-recursive, keep the compiler's stack discipline (nothing on the
+    stack at labels and jumps, one value at return), and use statics only
+    if the caller is in the same file, as there is no way to name another
+    file's statics. In the body:
+    - the arguments are popped off the stack into slots, and the body's
+      argument and local accesses go to those slots. The slots are temp
+      segment entries no file uses, if the body makes no calls, and extra
+      locals of the caller otherwise, so that they survive the calls.
+    - locals are zeroed, as 'function' does, unless first set.
+    - return jumps to a label after the body, with the return value on the
+      stack, as after the call.
+    - labels are renamed apart from the caller's.
+    - if the body sets 'pointer' and the caller uses 'this'/'that', the
+      caller's pointer is saved before the body and restored after it, as
+      return would.
+    Bodies are inlined as they were before inlining, one level deep. The
+    functions themselves stay, for the calls left and for tree shaking.
+    Sys.halt never returns, so isn't worth inlining; it stays a call, which
+    VMInterpreter halts on.
+
+    Example usage:
+        inliner = Inliner(max_size=12)
+        files = inliner.inline(files) # [(.vm file name, [Command])]
+        inliner.inlined # {'Math.abs' : 3, ...}
+    """
+
+    def __init__(self, max_size: int = INLINE_MAX_SIZE):
+        self.max_size = max_size
+        self.inlined = {} # function name -> call sites inlined
+
+    def inline(self, files: list) -> list:
+        """Inline calls in 'files', a list of (.vm file name, [Command]),
+        and return the new list."""
+        self._bodies = self._find_inlinable(files)
+        used = {cmd.arg2 for _, commands in files for cmd in commands
+                if cmd.op in (vm.PUSH, vm.POP) and cmd.arg1 == 'temp'}
+        self._temps = [i for i in range(8) if i not in used]
+        result = []
+        for path, commands in files:
+            filename = _filename(path)
+            out = []
+            for func in _split_functions(commands):
+                out += self._inline_function(func, filename)
+            result.append((path, out))
+        return result
+
+    def _find_inlinable(self, files: list) -> dict:
+        # function name -> _Body, for the functions that can be inlined
+        graph = call_graph(files)
+        bodies = {}
+        for path, commands in files:
+            for func in _split_functions(commands):
+                name = func[0].arg1
+                if (func[0].op != vm.FUNCTION or name == 'Sys.halt'
+                        or _code_size(func) - 1 > self.max_size
+                        or not _returns_one_value(func)
+                        or name in _reachable(graph, graph[name])):
+                    continue
+                bodies[name] = _Body(func, _filename(path))
+        return bodies
+
+    def _inline_function(self, func: list, filename: str) -> list:
+        if func[0].op != vm.FUNCTION:
+            return func
+        n_locals = func[0].arg2
+        labels = _labels(func)
+        uses_pointer = [_uses_pointer(func, i) for i in (0, 1)]
+        extra = 0
+        out = [func[0]]
+        for cmd in func[1:]:
+            body = self._bodies.get(cmd.arg1) if cmd.op == vm.CALL else None
+            if (body is None or body.max_argument >= cmd.arg2
+                    or (body.uses_static and body.filename != filename)):
+                out.append(cmd)
+                continue
+            saves = [i for i in body.sets_pointer if uses_pointer[i]]
+            n_slots = cmd.arg2 + body.n_locals + len(saves)
+            if not body.calls and n_slots <= len(self._temps):
+                slots = [('temp', i) for i in self._temps[:n_slots]]
+            else:
+                slots = [('local', n_locals + i) for i in range(n_slots)]
+                extra = max(extra, n_slots)
+            out += body.expand(cmd.arg2, slots, saves, _new_prefix(cmd.arg1, labels))
+            self.inlined[cmd.arg1] = self.inlined.get(cmd.arg1, 0) + 1
+        if extra:
+            out[0] = command(f'function {func[0].arg1} {n_locals + extra}')
+        return out
+
+
+class _Body:
+    # an inlinable function's body and what inlining it needs to know
+
+    def __init__(self, func: list, filename: str):
+        self.filename = filename
+        self.n_locals = func[0].arg2
+        self.commands = func[1:]
+        accesses = [cmd for cmd in self.commands if cmd.op in (vm.PUSH, vm.POP)]
+        self.max_argument = max((cmd.arg2 for cmd in accesses if cmd.arg1 == 'argument'),
+                                default=-1)
+        self.uses_static = any(cmd.arg1 == 'static' for cmd in accesses)
+        self.sets_pointer = sorted({cmd.arg2 for cmd in accesses
+                                    if cmd.op == vm.POP and cmd.arg1 == 'pointer'})
+        self.calls = any(cmd.op == vm.CALL for cmd in self.commands)
+        # locals not set before being read or jumped over need zeroing
+        seen, set_first = set(), set()
+        for cmd in self.commands:
+            if cmd.op in (vm.LABEL, vm.GOTO, vm.IF_GOTO, vm.RETURN):
+                break
+            if cmd.op in (vm.PUSH, vm.POP) and cmd.arg1 == 'local' and cmd.arg2 not in seen:
+                seen.add(cmd.arg2)
+                if cmd.op == vm.POP:
+                    set_first.add(cmd.arg2)
+        self.zeroed = [i for i in range(self.n_locals) if i not in set_first]
+
+    def expand(self, n_args: int, slots: list, saves: list, prefix: str) -> list:
+        # the body in place of a call with 'n_args' arguments, using 'slots'
+        # [(segment, index)] for the arguments, locals and saved pointers
+        args = slots[:n_args]
+        locals_ = slots[n_args:n_args + self.n_locals]
+        saved = slots[n_args + self.n_locals:]
+        out = []
+        for i, (segment, index) in zip(saves, saved):
+            out += [command(f'push pointer {i}'), command(f'pop {segment} {index}')]
+        for segment, index in reversed(args):
+            out.append(command(f'pop {segment} {index}'))
+        for i in self.zeroed:
+            out += [command('push constant 0'), command('pop {} {}'.format(*locals_[i]))]
+        end = f'{prefix}.return'
+        for n, cmd in enumerate(self.commands):
+            op = cmd.op
+            if op in (vm.PUSH, vm.POP) and cmd.arg1 in ('argument', 'local'):
+                segment, index = (args if cmd.arg1 == 'argument' else locals_)[cmd.arg2]
+                cmd = command(f'{cmd.text.split()[0]} {segment} {index}')
+            elif op in (vm.LABEL, vm.GOTO, vm.IF_GOTO):
+                cmd = command(f'{cmd.text.split()[0]} {prefix}.{cmd.arg1}')
+            elif op == vm.RETURN:
+                if n == len(self.commands) - 1:
+                    continue # falls through to the end
+                cmd = command(f'goto {end}')
+            out.append(cmd)
+        out.append(command(f'label {end}'))
+        for i, (segment, index) in zip(saves, saved):
+            out += [command(f'push {segment} {index}'), command(f'pop pointer {i}')]
+        return out
+
+
+def _filename(path: str) -> str:
+    return os.path.basename(path)[:-3]
+
+def _new_prefix(name: str, labels: set) -> str:
+    # a label prefix no label of 'labels' starts with
+    n = 0
+    while any(label.startswith(f'{name}.{n}.') for label in labels):
+        n += 1
+    prefix = f'{name}.{n}'
+    labels.add(f'{prefix}.return')
+    return prefix
+
+def _uses_pointer(commands: list, i: int) -> bool:
+    segment = ('this', 'that')[i]
+    return any(cmd.op in (vm.PUSH, vm.POP) and
+               (cmd.arg1 == segment or (cmd.arg1 == 'pointer' and cmd.arg2 == i))
+               for cmd in commands)
+
+def _returns_one_value(func: list) -> bool:
+    # whether the function returns, with one value on its stack at every
+    # return and none at labels and jumps
+    depth = 0
+    returns = False
+    for cmd in func[1:]:
+        op = cmd.op
+        if op == vm.PUSH:
+            depth += 1
+        elif op == vm.POP or op in _BINARY:
+            depth -= 1
+        elif op == vm.CALL:
+            depth += 1 - cmd.arg2
+        elif op == vm.IF_GOTO:
+            depth -= 1
+        elif op == vm.RETURN:
+            if depth != 1:
+                return False
+            returns = True
+            depth = 0
+        if depth < 0 or op == vm.UNKNOWN:
+            return False
+        if op in (vm.LABEL, vm.GOTO, vm.IF_GOTO) and depth:
+            return False
+    return returns
+
+
+def _code_size(commands: list) -> int:
+    return sum(1 for cmd in commands if cmd.op != vm.LABEL)
+
+def _split_functions(commands: list) -> list:
+    # [[Command]], one list per function (and one for any code before the first)
+    funcs = []
+    for cmd in commands:
+        if cmd.op == vm.FUNCTION or not funcs:
+            funcs.append([])
+        funcs[-1].append(cmd)
+    return funcs
+
+def _is_constant(cmd) -> bool:
+    return cmd.op == vm.PUSH and cmd.arg1 == 'constant'
+
+def _trailing_constant(out: list, end: int):
+    # (value, start) if out[start:end] pushes a constant: 'push constant c',
+    # optionally followed by 'neg' or 'not'; else None
+    if end >= 1 and _is_constant(out[end - 1]):
+        return out[end - 1].arg2, end - 1
+    if end >= 2 and out[end - 1].op in _UNARY and _is_constant(out[end - 2]):
+        return _UNARY[out[end - 1].op](out[end - 2].arg2), end - 2
+    return None
+
+def _push_constant(value: int) -> list:
+    # the shortest commands pushing a 16-bit value
+    if value <= 0x7FFF:
+        return [command(f'push constant {value}')]
+    if value == 0xFFFF:
+        return [command('push constant 0'), command('not')]
+    if -value & 0xFFFF <= 0x7FFF:
+        return [command(f'push constant {-value & 0xFFFF}'), command('neg')]
+    return [command(f'push constant {value ^ 0xFFFF}'), command('not')] # -32768
+
+def _fold_constants(commands: list) -> list:
+    out = []
+    for cmd in commands:
+        op = cmd.op
+        if op in _BINARY:
+            y = _trailing_constant(out, len(out))
+            x = y and _trailing_constant(out, y[1])
+            if x:
+                del out[x[1]:]
+                out += _push_constant(_BINARY[op](x[0], y[0]))
+                continue
+        elif op in _UNARY:
+            x = _trailing_constant(out, len(out))
+            if x and x[1] < len(out) - 1:
+                # 'push constant c; neg' and 'not' are already the shortest
+                del out[x[1]:]
+                out += _push_constant(_UNARY[op](x[0]))
+                continue
+            if x is None and out and out[-1].op == op:
+                out.pop() # not; not or neg; neg
+                continue
+        elif op == vm.IF_GOTO:
+            x = _trailing_constant(out, len(out))
+            if x:
+                del out[x[1]:]
+                if x[0]:
+                    out.append(command(f'goto {cmd.arg1}'))
+                continue
+        out.append(cmd)
+    return out
+
+_ARRAY_STORE = ('pop temp 0', 'pop pointer 1', 'push temp 0', 'pop that 0')
+
+def _is_array_store(commands: list, i: int) -> bool:
+    return tuple(cmd.text for cmd in commands[i:i + 4]) == _ARRAY_STORE
+
+def _forward_array_stores(commands: list) -> list:
+    # 'push X; pop temp 0; pop pointer 1; push temp 0; pop that 0' ->
+    # 'pop pointer 1; push X; pop that 0', if temp 0 is only read in such stores
+    if any(cmd.text == 'push temp 0' and (i < 2 or not _is_array_store(commands, i - 2))
+           for i, cmd in enumerate(commands)):
+        return commands
+    out = []
+    i = 0
+    while i < len(commands):
+        cmd = commands[i]
+        if (cmd.op == vm.PUSH and cmd.arg1 != 'that' and cmd.text != 'push pointer 1'
+                and _is_array_store(commands, i + 1)):
+            out += [commands[i + 2], cmd, commands[i + 4]]
+            i += 5
+            continue
+        out.append(cmd)
+        i += 1
+    return out
+
+def _labels(commands: list) -> set:
+    return {cmd.arg1 for cmd in commands if cmd.op == vm.LABEL}
+
+def _new_label(name: str, labels: set) -> str:
+    n = 0
+    while f'{name}.{n}' in labels:
+        n += 1
+    labels.add(f'{name}.{n}')
+    return f'{name}.{n}'
+
+def _invert_conditions(commands: list) -> list:
+    # 'not; if-goto L; A; label L' with A ending in goto/return ->
+    # 'if-goto L2; label L; ...; label L2; A', A moved to the end
+    if not commands or commands[-1].op not in (vm.GOTO, vm.RETURN):
+        return commands
+    labels = _labels(commands)
+    for i in range(len(commands) - 1):
+        if commands[i].op != vm.NOT or commands[i + 1].op != vm.IF_GOTO:
+            continue
+        if not _is_boolean(commands, i):
+            continue # 'not x' is true for any x but -1, not only for 0
+        target = commands[i + 1].arg1
+        end = next((j for j in range(i + 2, len(commands))
+                    if commands[j].op == vm.LABEL and commands[j].arg1 == target), None)
+        if end is None or end == i + 2 or commands[end - 1].op not in (vm.GOTO, vm.RETURN):
+            continue
+        moved = _new_label(f'{target}.not', labels)
+        return (commands[:i] + [command(f'if-goto {moved}')] + commands[end:] +
+                [command(f'label {moved}')] + commands[i + 2:end])
+    return commands
+
+def _expression_start(commands: list, end: int):
+    # the index where the code computing the top stack value at 'end'
+    # starts, or None if that isn't straight-line code
+    depth = 0
+    for i in range(end - 1, -1, -1):
+        cmd = commands[i]
+        if cmd.op == vm.PUSH:
+            depth += 1
+        elif cmd.op in _BINARY or cmd.op == vm.POP:
+            depth -= 1
+        elif cmd.op == vm.CALL:
+            depth += 1 - cmd.arg2
+        elif cmd.op not in _UNARY:
+            return None
+        if depth == 1:
+            return i
+    return None
+
+def _is_boolean(commands: list, end: int) -> bool:
+    # whether the top stack value at 'end' is always 0 or -1
+    cmd = commands[end - 1] if end else None
+    if cmd is None:
+        return False
+    if cmd.op in (vm.EQ, vm.GT, vm.LT):
+        return True
+    if _is_constant(cmd):
+        return cmd.arg2 == 0
+    if cmd.op == vm.NOT:
+        return _is_boolean(commands, end - 1)
+    if cmd.op in (vm.AND, vm.OR):
+        second = _expression_start(commands, end - 1)
+        return (second is not None and _is_boolean(commands, end - 1)
+                and _is_boolean(commands, second))
+    return False
+
+def _thread_jumps(commands: list) -> list:
+    # label -> index of the first non-label command after it
+    after = {}
+    for i, cmd in enumerate(commands):
+        if cmd.op == vm.LABEL:
+            j = i
+            while j < len(commands) and commands[j].op == vm.LABEL:
+                j += 1
+            after[cmd.arg1] = j
+
+    def final(label):
+        seen = set()
+        while label not in seen and label in after:
+            seen.add(label)
+            j = after[label]
+            if j < len(commands) and commands[j].op == vm.GOTO:
+                label = commands[j].arg1
+            else:
+                break
+        return label
+
+    out = []
+    for i, cmd in enumerate(commands):
+        if cmd.op in (vm.GOTO, vm.IF_GOTO):
+            target = final(cmd.arg1)
+            if cmd.op == vm.GOTO:
+                # a goto to one of the labels right after it falls through anyway
+                j = i + 1
+                while j < len(commands) and commands[j].op == vm.LABEL:
+                    if commands[j].arg1 in (cmd.arg1, target):
+                        break
+                    j += 1
+                if j < len(commands) and commands[j].op == vm.LABEL:
+                    continue
+            if target != cmd.arg1:
+                cmd = command(f'{"goto" if cmd.op == vm.GOTO else "if-goto"} {target}')
+        out.append(cmd)
+    return out
+
+def _remove_unreachable(commands: list) -> list:
+    used = {cmd.arg1 for cmd in commands if cmd.op in (vm.GOTO, vm.IF_GOTO)}
+    out = []
+    reachable = True
+    for cmd in commands:
+        if cmd.op == vm.LABEL:
+            if cmd.arg1 not in used:
+                continue
+            reachable = True
+        elif cmd.op == vm.FUNCTION:
+            reachable = True
+        if reachable:
+            out.append(cmd)
+        if cmd.op in (vm.GOTO, vm.RETURN):
+            reachable = False
+    return out
+
+
+def call_graph(files: list) -> dict:
+    """function -> set of functions it calls, for the functions of 'files',
+    a list of (.vm file name, [Command])."""
+    graph = {}
+    for _, commands in files:
+        callees = None
+        for cmd in commands:
+            if cmd.op == vm.FUNCTION:
+                callees = graph.setdefault(cmd.arg1, set())
+            elif cmd.op == vm.CALL and callees is not None:
+                callees.add(cmd.arg1)
+    return graph
+
+def reachable_functions(files: list, roots=('Sys.init',) + IMPLICIT_CALLS) -> set:
+    """The functions of 'files' that can be called, starting from 'roots'."""
+    return _reachable(call_graph(files), roots)
+
+def _reachable(graph: dict, roots) -> set:
+    found = set()
+    todo = [name for name in roots if name in graph]
+    while todo:
+        name = todo.pop()
+        if name not in found:
+            found.add(name)
+            todo += [callee for callee in graph[name] if callee in graph]
+    return found
+
+def shake(commands: list, keep: set) -> list:
+    """A file's Commands without the functions not in 'keep'."""
+    result = []
+    for func in _split_functions(commands):
+        if func[0].op != vm.FUNCTION or func[0].arg1 in keep:
+            result += func
+    return result
+
+def optimize_path(source: str, outdir: str = None, inliner: Inliner = None) -> VMOptimizer:
+    """Optimize a .vm file, or every .vm file of a directory, in place or
+    into 'outdir', first inlining calls with 'inliner' if given. Returns
+    the VMOptimizer, for its stats."""
+    if os.path.isfile(source):
+        paths = [source]
+    else:
+        paths = sorted(os.path.join(source, name) for name in os.listdir(source)
+                       if name.endswith('.vm'))
+    files = [(path, list(parser.Parser(path).commands())) for path in paths]
+    if inliner:
+        files = inliner.inline(files)
+    opt = VMOptimizer()
+    for path, commands in files:
+        commands = opt.optimize(commands)
+        write_vm(commands, os.path.join(outdir, os.path.basename(path)) if outdir else path)
+    return opt
+
+
+if __name__ == '__main__':
+    import argparse
+    argparser = argparse.ArgumentParser(description='Jack VM optimizer')
+    argparser.add_argument('source', help='a .vm file or a folder of .vm files')
+    argparser.add_argument('-o', '--out', metavar='DIR',
+                           help='write optimized files to DIR instead of in place')
+    argparser.add_argument('-i', '--inline', metavar='SIZE', nargs='?', type=int,
+                           const=INLINE_MAX_SIZE,
+                           help='inline calls to non-recursive functions of at most SIZE '
+                                f'commands (default {INLINE_MAX_SIZE})')
+    args = argparser.parse_args()
+
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+    inliner = Inliner(args.inline) if args.inline else None
+    opt = optimize_path(args.source, args.out, inliner)
+    if inliner:
+        print(f"{sum(inliner.inlined.values()):>8}  calls inlined")
+    for name, removed in opt.stats.items():
+        print(f"{removed:>8}  {name}")
+    saved = opt.commands_in - opt.commands_out
+    print(f"{opt.commands_in} -> {opt.commands_out} commands "
+          f"({100 * saved / max(opt.commands_in, 1):.1f}% removed)")
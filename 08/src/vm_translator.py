@@ -1,10 +1,17 @@
-import sys
 import os
+from concurrent.futures import ProcessPoolExecutor
 import vm_constants as vm
 import parser
 import code_writer
+import vm_optimizer
 
-def translate(source: str):
+def translate(
+        source: str,
+        optimize: bool = False,
+        shared: bool = False,
+        jobs: int = 1,
+        tree_shake: bool = False
+):
     """VM translator for the Jack VM to Hack assembly.
 
     Given a path 'source' to a .vm file or folder of .vm files, writes the Hack assembly translation of
@@ -12,9 +19,23 @@ def translate(source: str):
     - [single file]: my/Prog.vm -> my/Prog.asm
     - [directory]: my/Project -> my/Project/Project.asm
 
-    As above, the source base name should be uppercase (and end in '.vm' if it's a file).
+    As above, the source base name should be uppercase (and end in '.vm' if it's a file). The files
+    of a directory are translated in sorted order, after the bootstrap.
 
     The final translated program is terminated with an infinite loop, per the Hack asm guidelines.
+
+    With 'optimize', code is generated by code_writer.OptimizingCodeWriter, which emits compact
+    templates for the same VM semantics (see its docstring for instruction counts). With 'shared',
+    code_writer.SharedRoutineCodeWriter also emits call, return and comparisons as jumps to one
+    shared copy of each, for the smallest ROM.
+
+    With 'jobs' > 1, each file is translated to an in-memory fragment by 'translate_file()' on a
+    pool of 'jobs' processes, and the fragments are joined in the same sorted order. Generated
+    labels are unique per file, so the output is identical to a serial translation.
+
+    With 'tree_shake', only functions reachable from Sys.init (and from the OS functions the
+    compiler calls implicitly, vm_optimizer.IMPLICIT_CALLS) through the static call graph are
+    translated.
     """
     files = []
     outpath = None
@@ -28,41 +49,87 @@ def translate(source: str):
             for entry in it:
                 if entry.name.endswith('.vm'):
                     files.append(entry.path)
+        files.sort()
 
-    cw = code_writer.CodeWriter(outpath)
-
-    for file in files:
-        p = parser.Parser(file)
-        cw.set_vm_filename(file)
-
-        while(p.has_more_lines()):
-            p.advance()
-            cw.write_verbatim(f'// {p.get_current_line()}') # comment for clarity
-            cmd_type = p.command_type()
-            if cmd_type == vm.CommandType.ARITHMETIC:
-                cw.write_arithmetic(p.arg_1())
-            elif cmd_type in (vm.CommandType.PUSH, vm.CommandType.POP):
-                cw.write_push_pop(cmd_type, p.arg_1(), int(p.arg_2()))
-            elif cmd_type == vm.CommandType.LABEL:
-                cw.write_label(p.arg_1())
-            elif cmd_type == vm.CommandType.GOTO:
-                cw.write_goto(p.arg_1())
-            elif cmd_type == vm.CommandType.IF_GOTO:
-                cw.write_if_goto(p.arg_1())
-            elif cmd_type == vm.CommandType.FUNCTION:
-                cw.write_function(p.arg_1(), int(p.arg_2()))
-            elif cmd_type == vm.CommandType.CALL:
-                cw.write_call(p.arg_1(), int(p.arg_2()))
-            elif cmd_type == vm.CommandType.RETURN:
-                cw.write_return()
-            else:
-                print("ERROR - UNKNOWN VM COMMAND")
+    if shared:
+        writer = code_writer.SharedRoutineCodeWriter
+    elif optimize:
+        writer = code_writer.OptimizingCodeWriter
+    else:
+        writer = code_writer.CodeWriter
+    cw = writer(outpath)
 
+    parsed = {}
+    keep = None
+    if tree_shake:
+        parsed = {file : list(parser.Parser(file).commands()) for file in files}
+        keep = vm_optimizer.reachable_functions(list(parsed.items()))
+
+    if jobs > 1 and len(files) > 1:
+        with ProcessPoolExecutor(jobs) as pool:
+            n = len(files)
+            for asm in pool.map(translate_file, files, [writer] * n, [keep] * n):
+                cw.write_fragment(asm)
+    else:
+        for file in files:
+            commands = parsed[file] if file in parsed else parser.Parser(file).commands()
+            if keep is not None:
+                commands = vm_optimizer.shake(commands, keep)
+            cw.set_vm_filename(file)
+            write_commands(cw, commands)
 
     cw.write_verbatim('// infinite loop')
     cw.write_infinite_loop()
     cw.close()
 
+def translate_file(filepath: str, writer: type = code_writer.CodeWriter, keep: set = None) -> str:
+    """Translate one .vm file with a 'writer' CodeWriter class, without
+    bootstrap, and return the assembly. If 'keep' is given, only the
+    functions in it are translated."""
+    cw = writer(bootstrap=False)
+    cw.set_vm_filename(filepath)
+    commands = parser.Parser(filepath).commands()
+    if keep is not None:
+        commands = vm_optimizer.shake(list(commands), keep)
+    write_commands(cw, commands)
+    return cw.getvalue()
+
+def write_commands(cw: code_writer.CodeWriter, commands):
+    """Translate parsed Commands with 'cw', dispatching on their opcodes."""
+    handlers = _handlers(cw)
+    comment = cw.write_verbatim
+    for cmd in commands:
+        comment(f'// {cmd.text}') # comment for clarity
+        handlers[cmd.op](cmd)
+
+def _handlers(cw: code_writer.CodeWriter) -> list:
+    # opcode -> function translating a Command of that opcode with 'cw'
+    handlers = [None] * len(vm.COMMAND_TYPES)
+    for op in range(vm.NOT + 1):
+        handlers[op] = lambda cmd: cw.write_arithmetic(cmd.arg1)
+    handlers[vm.PUSH] = lambda cmd: cw.write_push_pop(vm.CommandType.PUSH, cmd.arg1, cmd.arg2)
+    handlers[vm.POP] = lambda cmd: cw.write_push_pop(vm.CommandType.POP, cmd.arg1, cmd.arg2)
+    handlers[vm.LABEL] = lambda cmd: cw.write_label(cmd.arg1)
+    handlers[vm.GOTO] = lambda cmd: cw.write_goto(cmd.arg1)
+    handlers[vm.IF_GOTO] = lambda cmd: cw.write_if_goto(cmd.arg1)
+    handlers[vm.FUNCTION] = lambda cmd: cw.write_function(cmd.arg1, cmd.arg2)
+    handlers[vm.CALL] = lambda cmd: cw.write_call(cmd.arg1, cmd.arg2)
+    handlers[vm.RETURN] = lambda cmd: cw.write_return()
+    handlers[vm.UNKNOWN] = lambda cmd: print("ERROR - UNKNOWN VM COMMAND")
+    return handlers
+
 if __name__ == '__main__':
-    translate(sys.argv[1])
+    import argparse
+    argparser = argparse.ArgumentParser(description='VM translator')
+    argparser.add_argument('source', help='a .vm file or a folder of .vm files')
+    argparser.add_argument('-O', '--optimize', action='store_true',
+                           help='emit compact assembly (OptimizingCodeWriter)')
+    argparser.add_argument('-s', '--shared', action='store_true',
+                           help='also share call/return/compare code (SharedRoutineCodeWriter)')
+    argparser.add_argument('-j', '--jobs', type=int, default=1,
+                           help='translate the files of a directory on a pool of JOBS processes')
+    argparser.add_argument('-t', '--tree-shake', action='store_true',
+                           help='only translate functions reachable from Sys.init')
+    args = argparser.parse_args()
+    translate(args.source, args.optimize, args.shared, args.jobs, args.tree_shake)
 